@@ -1,42 +1,81 @@
+import time
+from typing import List, Tuple
 from Handlers import CLIIOHandler, BaseIOHandler
 from user_movies_table import User_movie_table
 from users import User, Authentication
+from user_registry import UserRegistry
+from genre_profiles import GenreProfileMatrix
+from recommender import ItemBasedRecommender
+from instrumentation import Instrumentation, timed
+from storage_engine import StorageEngine
+from result_cache import RESULT_CACHE
+from lsh_index import GenreLSHIndex
+from batch_precompute import PrecomputedResults
 import constants
 
 
 class Game:
-    def __init__(self, handler: BaseIOHandler):
-        self.users = []
+    def __init__(self, handler: BaseIOHandler, users: UserRegistry = None, storage: StorageEngine = None,
+                 similarity_index: GenreLSHIndex = None, precomputed: PrecomputedResults = None,
+                 genre_profiles: GenreProfileMatrix = None, recommender: ItemBasedRecommender = None):
+        # Several games (e.g. network sessions) may share one registry of users
+        self.users = users if users is not None else UserRegistry()
+        self.storage = storage
         self.signed_up_user = None
         self.is_on = True
         self.commands = {}
         self.handler = handler
+        # User whose table is pinned in memory by this session, see TableStore
+        self._pinned_user = None
+        # Models over all the users, shared by the sessions of a server like the users are
+        self.genre_profiles = genre_profiles if genre_profiles is not None else GenreProfileMatrix()
+        # Optional approximate search attached to the users, replaces the exact one when given
+        self.similarity_index = similarity_index
+        # Results of the offline batch_precompute job, served as they are
+        self.precomputed = precomputed
+        self.recommender = recommender if recommender is not None else ItemBasedRecommender()
 
     def set_commands(self):
         # This function now correctly assumes self.signed_up_user is not None
+        if self.signed_up_user.table_store is not None and self._pinned_user is not self.signed_up_user:
+            # The commands below hold the table, it must not be evicted while they are used
+            self.signed_up_user.table_store.pin(self.signed_up_user)
+            self._pinned_user = self.signed_up_user
+        # The table may be shared with other sessions of the user, so the handler is passed on every call
         self.commands = {
-            1: self.signed_up_user.movies_table.add_movies_from_user,
-            2: self.signed_up_user.movies_table.print_basic_stats,
-            3: self.signed_up_user.movies_table.get_movie_recommendation,
+            1: lambda: self.signed_up_user.movies_table.add_movies_from_user(self.handler),
+            2: lambda: self.signed_up_user.movies_table.print_basic_stats(self.handler),
+            3: lambda: self.signed_up_user.movies_table.get_movie_recommendation(self.handler),
             4: self.handle_users_comparison,
             5: self.handle_loading_from_json,
-            6: self.signed_up_user.movies_table.to_json,
+            6: lambda: self.signed_up_user.movies_table.to_json(),
             7: lambda: self.signed_up_user.change_password(self.handler),  # Use lambda to pass handler
-            8: self.logout_user
+            8: self.logout_user,
+            9: self.handle_finding_similar_users,
+            10: self.handle_collaborative_recommendations,
+            11: self.handle_saving_to_binary,
+            12: self.handle_loading_from_binary,
+            13: self.handle_showing_performance_stats,
+            14: self.handle_showing_precomputed_results,
+            15: self.handle_searching_titles
         }
 
     def logout_user(self):
         self.handler.display_output(f"Logging out {self.signed_up_user.user_name}...")
+        if self._pinned_user is not None:
+            self._pinned_user.table_store.unpin(self._pinned_user)
+            self._pinned_user = None
         self.signed_up_user = None
         self.commands = {}  # Clear user-specific commands
 
     def _is_username_taken(self, username: str) -> bool:
-        return any(user.user_name == username for user in self.users)
+        return username in self.users
 
     def show_main_menu(self):
         while self.is_on:
             if self.signed_up_user:
                 self._show_user_menu()
+                self._commit()
                 continue  # After logout, loop back to show main menu
 
             command = self.handler.get_user_input(constants.MAIN_MENU_MESSAGE + "\n")
@@ -44,20 +83,31 @@ class Game:
                 self._handle_log_in()
             elif command == '2':  # Signup
                 self._handle_sign_up()
+                self._commit()
             elif command == '3':  # Exit
                 self.is_on = False
             else:
                 self.handler.display_output("Invalid command, please try again.")
         self.handler.display_output("Goodbye!")
 
+    def _commit(self):
+        # Every finished command is durable before the next prompt
+        if self.storage is not None:
+            self.storage.commit()
+
+    @timed
     def _handle_sign_up(self):
         username = self.handler.get_user_input("Please enter you user name: ")
         if self._is_username_taken(username):
             self.handler.display_output("This username is already taken. Please try another one.")
             return
 
-        new_user = User(user_name=username, user_id=len(self.users), handler=self.handler)
-        self.users.append(new_user)
+        password_hash = Authentication.hash_password_async(Authentication.get_valid_password(self.handler)).result()
+        # Another session may have taken the name while the password was entered
+        new_user = self.users.register(username, password_hash)
+        if new_user is None:
+            self.handler.display_output("This username is already taken. Please try another one.")
+            return
         self.signed_up_user = new_user
         self.handler.display_output(f"Welcome {username}! Signup successful.")
         self.set_commands()
@@ -74,7 +124,7 @@ class Game:
 
         action = self.commands.get(command)
         if action:
-            action()
+            timed(action, name=f"Game command {command}")()
 
     def handle_users_comparison(self) -> None:
         another_user_name = self.handler.get_user_input("Enter another user name to compare with: ")
@@ -83,7 +133,7 @@ class Game:
             self.handler.display_output("You can't compare a user with themselves.")
             return
 
-        another_user = next((user for user in self.users if user.user_name == another_user_name), None)
+        another_user = self.users.get(another_user_name)
 
         if not another_user:
             self.handler.display_output("User doesn't exist.")
@@ -101,20 +151,108 @@ class Game:
             self.handler.display_output(f"The taste of {self.signed_up_user.user_name} and the taste of "
                                         f"{another_user_name} are not similar.")
 
+    def find_similar_users(self, user: User) -> List[User]:
+        if self.similarity_index is not None:
+            return self.similarity_index.similar_users(user)
+        self.genre_profiles.refresh(self.users)
+        return self.genre_profiles.similar_users(user)
+
+    def handle_finding_similar_users(self) -> None:
+        similar_users = self.find_similar_users(self.signed_up_user)
+        if similar_users:
+            self.handler.display_output(f"Users with a taste similar to {self.signed_up_user.user_name}: "
+                                        f"{', '.join(user.user_name for user in similar_users)}")
+        else:
+            self.handler.display_output("No users with a similar taste were found.")
+
+    def get_collaborative_recommendations(self, user: User) -> List[Tuple[str, float]]:
+        self.recommender.refresh(self.users)
+        return self.recommender.recommend(user)
+
+    def handle_collaborative_recommendations(self) -> None:
+        recommendations = self.get_collaborative_recommendations(self.signed_up_user)
+        if not recommendations:
+            self.handler.display_output("There are no recommendations.")
+            return
+        self.handler.display_output("Here are some recommendations based on the ranks of all users: ")
+        for title, predicted_rank in recommendations:
+            self.handler.display_output(f"{title} (predicted rank {predicted_rank})")
+
     def handle_loading_from_json(self):
         json_path = f"user_{self.signed_up_user.id}_data.json"
         new_table = User_movie_table.create_from_json(json_path, self.handler)
         if new_table:
-            self.signed_up_user.movies_table = new_table
-            self.handler.display_output("Movie data loaded successfully.")
+            self._replace_movies_table(new_table)
+
+    def handle_saving_to_binary(self):
+        path = self.signed_up_user.movies_table.to_binary()
+        self.handler.display_output(f"Movie data saved to {path}.")
+
+    def handle_loading_from_binary(self):
+        binary_path = f"user_{self.signed_up_user.id}_data"
+        new_table = User_movie_table.create_from_binary(binary_path, self.handler)
+        if new_table:
+            self._replace_movies_table(new_table)
+
+    def handle_showing_performance_stats(self):
+        cache_stats = RESULT_CACHE.stats()
+        self.handler.display_output(f"Result cache: hits={cache_stats['hits']} misses={cache_stats['misses']} "
+                                    f"entries={cache_stats['entries']}/{cache_stats['max_entries']}")
+        if not Instrumentation.enabled:
+            self.handler.display_output("Performance stats are off, start the game with --instrument.")
+            return
+        report = Instrumentation.report()
+        if not report:
+            self.handler.display_output("No operations were recorded yet.")
+        for line in report:
+            self.handler.display_output(line)
+
+    def handle_showing_precomputed_results(self):
+        if self.precomputed is None:
+            self.handler.display_output("No precomputed results were loaded, run batch_precompute.py first.")
+            return
+        result = self.precomputed.get(self.signed_up_user.id)
+        if result is None:
+            self.handler.display_output("There are no precomputed results for you yet.")
+            return
+        similar_users, recommendations = result
+        computed_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.precomputed.computed_at))
+        self.handler.display_output(f"Precomputed at {computed_at}:")
+        if similar_users:
+            self.handler.display_output(f"Users with a taste similar to {self.signed_up_user.user_name}: "
+                                        f"{', '.join(similar_users)}")
+        else:
+            self.handler.display_output("No users with a similar taste were found.")
+        if recommendations:
+            self.handler.display_output("Here are some recommendations for movies you may like: ")
+            for title in recommendations:
+                self.handler.display_output(title)
+        else:
+            self.handler.display_output("There are no recommendations.")
+
+    def handle_searching_titles(self):
+        prefix = self.handler.get_user_input("Enter the beginning of the title: ")
+        titles = self.signed_up_user.movies_table.search_titles(prefix)
+        if not titles:
+            self.handler.display_output("None of your movies starts with that.")
+            return
+        for title in titles:
+            self.handler.display_output(title)
+
+    def _replace_movies_table(self, new_table: User_movie_table):
+        self.signed_up_user.movies_table = new_table
+        # The new table must be pinned instead of the replaced one
+        self.set_commands()
+        self.handler.display_output("Movie data loaded successfully.")
 
+    @timed
     def _handle_log_in(self) -> None:
         user_name = self.handler.get_user_input("Enter user name: ")
-        user_to_login = next((user for user in self.users if user.user_name == user_name), None)
+        user_to_login = self.users.get(user_name)
 
         if user_to_login:
             password = self.handler.get_user_input("Enter user password: ")
-            if Authentication.check_password(password=password, hashed=user_to_login.password):
+            if Authentication.check_password_async(password, user_to_login.password).result():
                 self.signed_up_user = user_to_login
                 self.set_commands()
                 self.handler.display_output(f"Welcome back, {user_name}!")
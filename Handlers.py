@@ -1,4 +1,14 @@
+from __future__ import annotations
+import json
 from abc import ABC, abstractmethod
+from typing import Callable, Iterable, List, Optional, TextIO, Tuple
+from lazy_imports import lazy_import
+
+# Only the network server needs asyncio, the CLI starts without it
+asyncio = lazy_import("asyncio")
+
+# Line sent after every prompt, telling a network client that the server waits for its input
+INPUT_MARKER = ">"
 
 class BaseIOHandler(ABC):
     @abstractmethod
@@ -21,3 +31,111 @@ class CLIIOHandler(BaseIOHandler):
         for key, value in kwargs.items():
             print (f"{key}:{value}")
 
+
+class AsyncStreamIOHandler(BaseIOHandler):
+    """Serves a blocking Game running in a worker thread over asyncio streams of the event loop.
+
+    Outputs and prompts are sent as lines, every prompt is followed by an INPUT_MARKER line and the
+    answer is the next line the client sends."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop):
+        self._reader = reader
+        self._writer = writer
+        self._loop = loop
+
+    def _write_lines(self, lines):
+        for line in lines:
+            self._writer.write((line.rstrip("\n") + "\n").encode())
+
+    async def _prompt(self, message):
+        self._write_lines([message, INPUT_MARKER])
+        await self._writer.drain()
+        line = await self._reader.readline()
+        if not line:
+            raise EOFError("The client disconnected.")
+        return line.decode().rstrip("\r\n")
+
+    def get_user_input(self, message=""):
+        return asyncio.run_coroutine_threadsafe(self._prompt(message), self._loop).result()
+
+    def display_output(self, *args, **kwargs):
+        lines = [str(i) for i in args] + [f"{key}:{value}" for key, value in kwargs.items()]
+        self._loop.call_soon_threadsafe(self._write_lines, lines)
+
+
+class BatchIOHandler(BaseIOHandler):
+    """Answers the prompts from a JSONL script instead of a person, and buffers the outputs.
+
+    Every script line is either a JSON string or number, the next input, or an object: {"input": ...,
+    "expect": ...} is an input, and expect, if given, must appear in the outputs before the next input
+    is read. {"users": [...]} records are passed to on_users, e.g. to seed users with pre-hashed
+    passwords. Other objects and values are skipped. Reading past the end of the script raises EOFError."""
+
+    def __init__(self, lines: Iterable[str], output: Optional[TextIO] = None, buffer_lines: int = 10_000,
+                 on_users: Callable[[list], None] = None):
+        self._lines = iter(lines)
+        self._output = output
+        self._buffer_lines = buffer_lines
+        self._on_users = on_users
+        self._buffer = []
+        self._line_number = 0
+        self._expect = None
+        self._since_input = []
+        self.inputs = 0
+        self.outputs = 0
+        self.skipped = 0
+        # (script line number, expected text) of every expect that was not met
+        self.mismatches: List[Tuple[int, str]] = []
+
+    def _check_expect(self) -> None:
+        if self._expect is not None:
+            line_number, expected = self._expect
+            if not any(expected in output for output in self._since_input):
+                self.mismatches.append((line_number, expected))
+        self._expect = None
+        self._since_input = []
+
+    def get_user_input(self, message=""):
+        self._check_expect()
+        for line in self._lines:
+            self._line_number += 1
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, (str, int, float)) and not isinstance(record, bool):
+                self.inputs += 1
+                return str(record)
+            if not isinstance(record, dict):
+                self.skipped += 1
+            elif "input" in record:
+                if "expect" in record:
+                    self._expect = (self._line_number, record["expect"])
+                self.inputs += 1
+                return str(record["input"])
+            elif "users" in record and self._on_users is not None:
+                self._on_users(record["users"])
+            else:
+                self.skipped += 1
+        raise EOFError("The script has no more inputs.")
+
+    def display_output(self, *args, **kwargs):
+        lines = [str(i) for i in args] + [f"{key}:{value}" for key, value in kwargs.items()]
+        self.outputs += len(lines)
+        if self._expect is not None:
+            self._since_input.extend(lines)
+        if self._output is not None:
+            self._buffer.extend(lines)
+            if len(self._buffer) >= self._buffer_lines:
+                self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._output.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+        if self._output is not None:
+            self._output.flush()
+
+    def close(self) -> None:
+        """Checks the expect of the last input and writes the buffered outputs."""
+        self._check_expect()
+        self.flush()
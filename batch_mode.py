@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import sys
+import time
+from typing import List, NamedTuple, Optional, TextIO, Tuple
+from Game import Game
+from Handlers import BatchIOHandler
+from lazy_imports import lazy_import
+from user_registry import UserRegistry
+from users import User, NO_PASSWORD
+
+bcrypt = lazy_import("bcrypt")
+
+# Work factor of the hashes in generated scripts, the lowest bcrypt accepts, so logins cost ~1 ms
+SCRIPT_BCRYPT_ROUNDS = 4
+SCRIPT_PASSWORD = "Script123!"
+DEFAULT_SEED = 1507
+
+
+class ReplaySummary(NamedTuple):
+    inputs: int
+    outputs: int
+    mismatches: List[Tuple[int, str]]
+    seconds: float
+
+
+def seed_users(users: UserRegistry, records: list) -> int:
+    """Adds the users of a script's {"users": [...]} record and returns how many were added.
+
+    A record holds user_name and password_hash (a bcrypt hash, no password if missing), and
+    optionally user_id and movies as [name, rank, genre] rows. Taken user names are skipped."""
+    added = 0
+    for record in records:
+        if record["user_name"] in users:
+            continue
+        password_hash = record["password_hash"].encode() if record.get("password_hash") else NO_PASSWORD
+        if "user_id" in record:
+            user = User(record["user_name"], record["user_id"], password_hash=password_hash)
+            users.add(user)
+        else:
+            user = users.register(record["user_name"], password_hash)
+        if record.get("movies"):
+            user.movies_table.add_movies(record["movies"])
+        added += 1
+    return added
+
+
+def replay_script(path: str, users: UserRegistry, output: Optional[TextIO] = None, **game_options) -> ReplaySummary:
+    """Runs a Game driven by the JSONL script in path until the script ends, see BatchIOHandler.
+
+    game_options are passed to Game, e.g. storage."""
+    with open(path, "r") as file:
+        handler = BatchIOHandler(file, output, on_users=lambda records: seed_users(users, records))
+        game = Game(handler, users=users, **game_options)
+        start = time.perf_counter()
+        try:
+            game.show_main_menu()
+        except EOFError:
+            pass
+        finally:
+            handler.close()
+        seconds = time.perf_counter() - start
+    return ReplaySummary(handler.inputs, handler.outputs, handler.mismatches, seconds)
+
+
+def generate_script(sessions: int, movies_per_session: int = 5, seed: int = DEFAULT_SEED) -> List[str]:
+    """Returns the lines of a script of users logging in, rating movies, asking for stats and
+    recommendations and logging out. Every user's password is SCRIPT_PASSWORD."""
+    rng = random.Random(seed)
+    users_amount = max(1, sessions // 4)
+    password_hash = bcrypt.hashpw(SCRIPT_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=SCRIPT_BCRYPT_ROUNDS))
+    lines = [json.dumps({"users": [{"user_name": f"user{i}", "password_hash": password_hash.decode()}
+                                   for i in range(users_amount)]})]
+    for _ in range(sessions):
+        user_name = f"user{rng.randrange(users_amount)}"
+        inputs = ["1", user_name, {"input": SCRIPT_PASSWORD, "expect": f"Welcome back, {user_name}!"}, "1"]
+        for _ in range(movies_per_session):
+            inputs += [f"Movie {rng.randrange(1000)}", str(rng.randint(1, 10)), f"Genre {rng.randrange(10)}"]
+        inputs += ["quit", "2", "9", "8"]
+        lines.extend(json.dumps(value) for value in inputs)
+    lines.append(json.dumps("3"))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic script for main.py --script.")
+    parser.add_argument("output", help="path of the JSONL script")
+    parser.add_argument("--sessions", type=int, default=1_000)
+    parser.add_argument("--movies-per-session", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    with open(args.output, "w") as file:
+        for line in generate_script(args.sessions, args.movies_per_session, args.seed):
+            file.write(line + "\n")
+    print(f"Wrote {args.sessions} sessions to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
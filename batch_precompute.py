@@ -0,0 +1,178 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from catalog import CATALOG
+from genre_profiles import GenreProfileMatrix, similar_rows
+from lazy_imports import lazy_import
+from storage_engine import open_storage
+from user_movies_table import recommended_positions
+
+np = lazy_import("numpy")
+# Only the batch job needs processes, the game imports this module for PrecomputedResults
+futures = lazy_import("concurrent.futures")
+shared_memory = lazy_import("multiprocessing.shared_memory")
+
+DEFAULT_OUTPUT = "precomputed_results.json"
+RECOMMENDATIONS_AMOUNT = 5
+# Row ranges per worker, several of them so a slow range doesn't keep the other workers idle
+_CHUNKS_PER_WORKER = 4
+
+# Arrays of the worker process, attached from shared memory by _attach_arrays
+_worker_blocks = []
+_worker_arrays = {}
+
+
+class PrecomputedResults:
+    """Similar users and recommendations of every user, computed by precompute() and read by the game."""
+
+    def __init__(self, results: Dict[int, Tuple[List[str], List[str]]] = None, computed_at: float = None):
+        # user id -> (names of the similar users, recommended titles)
+        self.results = results if results is not None else {}
+        self.computed_at = computed_at if computed_at is not None else time.time()
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def get(self, user_id: int) -> Optional[Tuple[List[str], List[str]]]:
+        return self.results.get(user_id)
+
+    def save(self, path: str) -> None:
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"computed_at": self.computed_at,
+                       "users": {str(user_id): {"similar": similar, "recommendations": recommendations}
+                                 for user_id, (similar, recommendations) in self.results.items()}}, file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['PrecomputedResults']:
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        return cls({int(user_id): (result["similar"], result["recommendations"])
+                    for user_id, result in data["users"].items()}, data["computed_at"])
+
+
+# --- Shared memory ---
+
+def _share(arrays: Dict[str, np.ndarray]) -> Tuple[List[shared_memory.SharedMemory], Dict[str, tuple]]:
+    """Copies the arrays to shared memory blocks, returns the blocks and what a worker needs to attach them."""
+    blocks = []
+    descriptors = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptors
+
+
+def _attach_arrays(descriptors: Dict[str, tuple]) -> None:
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+# --- Computation, run by the workers ---
+
+def _compute_rows(start: int, stop: int, amount: int, arrays: Dict[str, np.ndarray] = None) -> List[tuple]:
+    """Returns (row, similar rows, recommended title ids) for the rows in [start, stop)."""
+    arrays = arrays if arrays is not None else _worker_arrays
+    means, indptr, ranks = arrays["means"], arrays["indptr"], arrays["ranks"]
+    title_ids, title_keys = arrays["title_ids"], arrays["title_keys"]
+    results = []
+    for row in range(start, stop):
+        similar = np.flatnonzero(similar_rows(means, row))
+        seen_keys = set(title_keys[indptr[row]:indptr[row + 1]].tolist())
+        # The recommendations of every similar user, the best ranks first and the lower ids on ties,
+        # each movie once whatever the spelling of its title
+        best_ranks = {}
+        for order, other in enumerate(similar.tolist()):
+            other_rows = slice(indptr[other], indptr[other + 1])
+            other_ranks = ranks[other_rows]
+            positions = recommended_positions(seen_keys, title_keys[other_rows], other_ranks, amount)
+            for title_id, key, rank in zip(title_ids[other_rows][positions].tolist(),
+                                           title_keys[other_rows][positions].tolist(),
+                                           other_ranks[positions].tolist()):
+                if key not in best_ranks or (-rank, order) < best_ranks[key][0]:
+                    best_ranks[key] = ((-rank, order), title_id)
+        recommended = [title_id for _, title_id in sorted(best_ranks.values(), key=lambda value: value[0])[:amount]]
+        results.append((row, similar.tolist(), recommended))
+    return results
+
+
+def precompute(users, workers: Optional[int] = None, amount: int = RECOMMENDATIONS_AMOUNT) -> PrecomputedResults:
+    """Computes the similar users and the recommendations of every user with a pool of processes.
+
+    Similar users follow User_movie_table.are_similar, and the recommendations are the best of the
+    movies_recommendations_based_on_similarity lists of the similar users, each title once. The genre
+    means and the ratings are shared with the workers through shared memory instead of being pickled
+    to each one."""
+    workers = workers or os.cpu_count() or 1
+    matrix = GenreProfileMatrix()
+    matrix.refresh(users)
+    rows_users = list(matrix.users)
+    if not rows_users:
+        return PrecomputedResults()
+
+    columns = [user.movies_table.columns() for user in rows_users]
+    indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    np.cumsum([len(title_ids) for title_ids, _, _ in columns], out=indptr[1:])
+    title_ids = np.concatenate([title_ids for title_ids, _, _ in columns]).astype(np.int32)
+    arrays = {
+        "means": np.ascontiguousarray(matrix.values),
+        "indptr": indptr,
+        "title_ids": title_ids,
+        "title_keys": CATALOG.title_keys_of(title_ids),
+        "ranks": np.concatenate([ranks.astype(np.float64) for _, ranks, _ in columns]),
+    }
+
+    rows = len(rows_users)
+    if workers == 1:
+        computed = _compute_rows(0, rows, amount, arrays)
+    else:
+        chunk_size = max(1, -(-rows // (workers * _CHUNKS_PER_WORKER)))
+        blocks, descriptors = _share(arrays)
+        try:
+            with futures.ProcessPoolExecutor(max_workers=workers, initializer=_attach_arrays,
+                                     initargs=(descriptors,)) as executor:
+                submitted = [executor.submit(_compute_rows, start, min(start + chunk_size, rows), amount)
+                             for start in range(0, rows, chunk_size)]
+                computed = [result for future in submitted for result in future.result()]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    results = {}
+    for row, similar, recommended in computed:
+        results[rows_users[row].id] = ([rows_users[other].user_name for other in similar],
+                                       [CATALOG.title(title_id) for title_id in recommended])
+    return PrecomputedResults(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the similar users and recommendations of all users.")
+    parser.add_argument("--data-dir", metavar="PATH", required=True, help="data directory of the game")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="file the results are written to")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, all cores by default")
+    parser.add_argument("--amount", type=int, default=RECOMMENDATIONS_AMOUNT, help="recommendations per user")
+    args = parser.parse_args()
+
+    # The game may be running on the directory, the job only reads it
+    storage, users = open_storage(args.data_dir, read_only=True)
+    start = time.perf_counter()
+    results = precompute(users, args.workers, args.amount)
+    results.save(args.output)
+    storage.close()
+    print(f"Precomputed {len(results)} users in {time.perf_counter() - start:.2f}s, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
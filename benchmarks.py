@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+from Handlers import BaseIOHandler
+from result_cache import RESULT_CACHE
+from user_movies_table import User_movie_table
+from users import Authentication
+
+DEFAULT_SEED = 1507
+DEFAULT_ROWS = [1_000, 10_000]
+DEFAULT_OUTPUT = "bench_output.json"
+BENCHMARK_PASSWORD = "Bench123!"
+
+
+class ScriptedIOHandler(BaseIOHandler):
+    """Answers prompts from a prepared list of inputs and drops every output."""
+
+    def __init__(self, inputs: List[str] = ()):
+        self._inputs = iter(inputs)
+
+    def get_user_input(self, message=""):
+        return next(self._inputs)
+
+    def display_output(self, *args, **kwargs):
+        pass
+
+
+# --- Synthetic data ---
+
+def generate_genres(count: int) -> List[str]:
+    return [f"Genre {i}" for i in range(count)]
+
+
+def generate_movies(count: int, genres: List[str], rng: random.Random) -> List[Tuple[str, str]]:
+    """Returns (name, genre) pairs of distinct movies."""
+    return [(f"Movie {i}", rng.choice(genres)) for i in range(count)]
+
+
+def generate_ratings(rows: int, movies: List[Tuple[str, str]], rng: random.Random) -> List[Tuple[str, int, str]]:
+    """Returns (name, rank, genre) rows of a single user, one per movie, so a table of them has
+    min(rows, len(movies)) rows."""
+    picked = rng.sample(movies, min(rows, len(movies)))
+    return [(name, rng.randint(1, 10), genre) for name, genre in picked]
+
+
+def generate_user_tables(users: int, rows_per_user: int, movies: List[Tuple[str, str]],
+                         rng: random.Random) -> List[User_movie_table]:
+    tables = []
+    for user_id in range(users):
+        table = User_movie_table(user_id, ScriptedIOHandler())
+        table.add_movies(generate_ratings(rows_per_user, movies, rng))
+        tables.append(table)
+    return tables
+
+
+def similar_copy(table: User_movie_table, user_id: int) -> User_movie_table:
+    """Returns a table of other movies with the same genre profile, so are_similar holds."""
+    copy = User_movie_table(user_id, ScriptedIOHandler())
+    copy.add_movies((f"Other {name}", rank, genre) for name, rank, genre in table.iter_rows())
+    return copy
+
+
+# --- Timing ---
+
+def measure(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"best_seconds": min(timings), "mean_seconds": sum(timings) / len(timings)}
+
+
+def uncached(function: Callable[[], object], *tables: User_movie_table) -> Callable[[], object]:
+    """Returns function running with the tables' results dropped from RESULT_CACHE first, so every
+    repeat measures the computation and not a cache hit."""
+    def run():
+        for table in tables:
+            RESULT_CACHE.invalidate(table)
+        return function()
+    return run
+
+
+def run_benchmarks(rows_scales: List[int], seed: int = DEFAULT_SEED, repeat: int = 3, genres: int = 20,
+                   bcrypt_rounds: int = None) -> dict:
+    results = []
+
+    def record(name: str, rows: int, timings: Dict[str, float]) -> None:
+        results.append({"name": name, "rows": rows, **timings,
+                        "rows_per_sec": rows / timings["best_seconds"] if timings["best_seconds"] else None})
+
+    for rows in rows_scales:
+        rng = random.Random(seed)
+        # As many movies as rows, every rating adds a row of its own
+        movies = generate_movies(rows, generate_genres(genres), rng)
+        ratings = generate_ratings(rows, movies, rng)
+
+        def add_movies_from_user():
+            inputs = [value for name, rank, genre in ratings for value in (name, str(rank), genre)] + ["quit"]
+            table = User_movie_table(0, ScriptedIOHandler(inputs))
+            table.add_movies_from_user()
+            return table.df
+
+        record("add_movies_from_user", rows, measure(add_movies_from_user, repeat))
+
+        table = User_movie_table(0, ScriptedIOHandler())
+        table.add_movies(ratings)
+        # Merge the appended rows before timing the reads
+        table.df
+        record("print_basic_stats", rows, measure(table.print_basic_stats, repeat))
+
+        prompts = min(rows, 1000)
+
+        def get_movie_recommendation():
+            genre_names = [genre for _, _, genre in ratings[:prompts]]
+            inputs = [value for genre in genre_names for value in (genre, "")]
+            inputs[-1] = "exit"
+            table.handler = ScriptedIOHandler(inputs)
+            table.get_movie_recommendation()
+
+        record("_get_movie_recommendation", rows, measure(uncached(get_movie_recommendation, table), repeat))
+
+        other = similar_copy(table, 1)
+        record("are_similar", rows, measure(
+            uncached(lambda: User_movie_table.are_similar(table, other), table, other), repeat))
+        record("movies_recommendations_based_on_similarity", rows, measure(uncached(
+            lambda: User_movie_table.movies_recommendations_based_on_similarity(table, other, ScriptedIOHandler()),
+            table, other), repeat))
+
+        with tempfile.TemporaryDirectory() as directory:
+            current_directory = os.getcwd()
+            os.chdir(directory)
+            try:
+                record("to_json", rows, measure(table.to_json, repeat))
+                record("create_from_json", rows, measure(
+                    lambda: User_movie_table.create_from_json("user_0_data.json", ScriptedIOHandler()), repeat))
+            finally:
+                os.chdir(current_directory)
+
+    previous_rounds = Authentication.rounds
+    if bcrypt_rounds:
+        Authentication.configure(rounds=bcrypt_rounds)
+    try:
+        hashed = Authentication.hash_password(BENCHMARK_PASSWORD)
+        record("bcrypt_login", 1, measure(lambda: Authentication.check_password(BENCHMARK_PASSWORD, hashed), repeat))
+    finally:
+        Authentication.configure(rounds=previous_rounds)
+
+    return {
+        "seed": seed,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(current: dict, previous: dict) -> List[str]:
+    """Returns a line per benchmark present in both reports with the change of its best time."""
+    previous_results = {(result["name"], result["rows"]): result for result in previous["results"]}
+    lines = []
+    for result in current["results"]:
+        old = previous_results.get((result["name"], result["rows"]))
+        if old and old["best_seconds"]:
+            ratio = result["best_seconds"] / old["best_seconds"]
+            lines.append(f"{result['name']} ({result['rows']} rows): x{ratio:.2f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot paths of the game on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="table sizes to benchmark, e.g. 1000 100000 10000000")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--bcrypt-rounds", type=int, help="work factor of the login benchmark")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", metavar="PREVIOUS_OUTPUT", help="report the change from an earlier run")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.rows, args.seed, args.repeat, args.genres, args.bcrypt_rounds)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    for result in report["results"]:
+        print(f"{result['name']} ({result['rows']} rows): {result['best_seconds'] * 1000:.3f} ms")
+    if args.compare:
+        with open(args.compare, "r") as file:
+            for line in compare(report, json.load(file)):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
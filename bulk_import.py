@@ -0,0 +1,61 @@
+from __future__ import annotations
+import time
+from typing import Iterator, NamedTuple
+from Handlers import BaseIOHandler
+from lazy_imports import lazy_import
+from user_movies_table import Columns
+from users import NO_PASSWORD
+
+pd = lazy_import("pandas")
+
+USER_NAME_COLUMN = 'user_name'
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+class ImportSummary(NamedTuple):
+    rows: int
+    users_created: int
+    seconds: float
+
+
+def _read_chunks(path: str, chunk_size: int, columns: list) -> Iterator[pd.DataFrame]:
+    if path.endswith(('.jsonl', '.json')):
+        with pd.read_json(path, lines=True, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield chunk[columns]
+    else:
+        with pd.read_csv(path, chunksize=chunk_size, usecols=columns) as reader:
+            yield from reader
+
+
+def import_ratings(game, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, user_column: str = USER_NAME_COLUMN,
+                   name_column: str = Columns.Name.value, rank_column: str = Columns.Rank.value,
+                   genre_column: str = Columns.Genre.value, handler: BaseIOHandler = None) -> ImportSummary:
+    """Streams a CSV or JSONL ratings dump into the users of the game, chunk_size rows at a time.
+
+    Users that don't exist yet are created without a password, so nobody can log in to them until
+    one is set. Rows are routed to each user's movie table with one bulk add per user per chunk."""
+    handler = handler or game.handler
+    columns = [user_column, name_column, rank_column, genre_column]
+    rows = users_created = 0
+    start = time.perf_counter()
+
+    for chunk in _read_chunks(path, chunk_size, columns):
+        for user_name, user_rows in chunk.groupby(user_column, sort=False):
+            user_name = str(user_name)
+            user = game.users.get(user_name)
+            if user is None:
+                user = game.users.register(user_name, NO_PASSWORD)
+                users_created += 1
+            user.movies_table.add_movies(zip(user_rows[name_column].astype(str).tolist(),
+                                             user_rows[rank_column].tolist(),
+                                             user_rows[genre_column].astype(str).tolist()))
+        rows += len(chunk)
+        if game.storage is not None:
+            game.storage.commit()
+        elapsed = time.perf_counter() - start
+        handler.display_output(f"Imported {rows} rows, {users_created} new users "
+                               f"({rows / elapsed if elapsed else 0:.0f} rows/sec)")
+
+    return ImportSummary(rows, users_created, time.perf_counter() - start)
+
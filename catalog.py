@@ -0,0 +1,168 @@
+from __future__ import annotations
+import threading
+from typing import Iterable, Optional
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+
+class _Interner:
+    """Gives every distinct string an id, in order of first appearance."""
+
+    def __init__(self):
+        self.values = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        # Object array of the values, grown geometrically, so ids translate back with one take
+        self._array = None
+        self._array_size = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, value: str) -> Optional[int]:
+        return self._ids.get(value)
+
+    def intern(self, value: str) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            with self._lock:
+                value_id = self._ids.get(value)
+                if value_id is None:
+                    value_id = len(self.values)
+                    self.values.append(value)
+                    self._ids[value] = value_id
+        return value_id
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        size = len(self.values)
+        if self._array_size < size:
+            with self._lock:
+                capacity = 0 if self._array is None else len(self._array)
+                if capacity < size:
+                    grown = np.empty(max(size, 2 * capacity, 16), dtype=object)
+                    if self._array is not None:
+                        grown[:self._array_size] = self._array[:self._array_size]
+                    self._array = grown
+                self._array[self._array_size:size] = self.values[self._array_size:size]
+                self._array_size = size
+        if self._array is None:
+            return np.empty(0, dtype=object)
+        return self._array[ids]
+
+
+class _IdColumn:
+    """Growable int32 column mapping ids to other ids, appended to under the catalog's lock."""
+
+    def __init__(self):
+        self._values = None
+        self._size = 0
+
+    def append(self, value: int) -> None:
+        if self._values is None or self._size == len(self._values):
+            grown = np.empty(max(16, 2 * self._size), dtype=np.int32)
+            if self._values is not None:
+                grown[:self._size] = self._values
+            self._values = grown
+        self._values[self._size] = value
+        self._size += 1
+
+    def __getitem__(self, value_id: int) -> int:
+        return int(self._values[value_id])
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        if self._values is None:
+            return np.empty(0, dtype=np.int32)
+        return self._values[:self._size][ids]
+
+
+def normalize_title(title: str) -> str:
+    """Returns the title case-folded with its whitespace collapsed, titles equal this way are one movie."""
+    return " ".join(title.split()).casefold()
+
+
+class Catalog:
+    """Movie titles and genres shared by all the tables, each stored once and referred to by an id.
+
+    Titles and genres keep the spelling they were entered with. Every title spelling is also mapped
+    to the id of its normalize_title form, which tables use to tell movies apart, and every genre
+    spelling to the id of its lower-cased form, which the genre searches group by."""
+
+    def __init__(self):
+        self.titles = _Interner()
+        self.title_keys = _Interner()
+        self.genres = _Interner()
+        self.genre_keys = _Interner()
+        # title id -> id of the normalized title
+        self._key_of_title = _IdColumn()
+        # genre id -> id of the lower-cased genre
+        self._key_of_genre = _IdColumn()
+        self._lock = threading.Lock()
+
+    def title_id(self, title: str) -> int:
+        title_id = self.titles.get(title)
+        if title_id is None:
+            with self._lock:
+                title_id = self.titles.get(title)
+                if title_id is None:
+                    # The key is stored first, a title id is never seen without it
+                    self._key_of_title.append(self.title_keys.intern(normalize_title(title)))
+                    title_id = self.titles.intern(title)
+        return title_id
+
+    def find_title(self, title: str) -> Optional[int]:
+        """Returns the id of a title without adding it, or None if no table has it."""
+        return self.titles.get(title)
+
+    def find_title_key(self, title: str) -> Optional[int]:
+        """Returns the normalized title id of any spelling of a title, or None if no table has it."""
+        return self.title_keys.get(normalize_title(title))
+
+    def title_key(self, title_id: int) -> int:
+        return self._key_of_title[title_id]
+
+    def title_keys_of(self, ids: np.ndarray) -> np.ndarray:
+        """Returns the normalized title id of every title id."""
+        return self._key_of_title.take(ids)
+
+    def normalized_title(self, key_id: int) -> str:
+        return self.title_keys.values[key_id]
+
+    def genre_id(self, genre: str) -> int:
+        genre_id = self.genres.get(genre)
+        if genre_id is None:
+            with self._lock:
+                genre_id = self.genres.get(genre)
+                if genre_id is None:
+                    # The key is stored first, a genre id is never seen without it
+                    self._key_of_genre.append(self.genre_keys.intern(genre.lower()))
+                    genre_id = self.genres.intern(genre)
+        return genre_id
+
+    def title_ids(self, titles: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.title_id(title) for title in titles), dtype=np.int32)
+
+    def genre_ids(self, genres: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.genre_id(genre) for genre in genres), dtype=np.int32)
+
+    def title(self, title_id: int) -> str:
+        return self.titles.values[title_id]
+
+    def genre(self, genre_id: int) -> str:
+        return self.genres.values[genre_id]
+
+    def titles_of(self, ids: np.ndarray) -> np.ndarray:
+        return self.titles.take(ids)
+
+    def genres_of(self, ids: np.ndarray) -> np.ndarray:
+        return self.genres.take(ids)
+
+    def genre_keys_of(self, ids: np.ndarray) -> np.ndarray:
+        """Returns the lower-cased genre id of every genre id."""
+        return self._key_of_genre.take(ids)
+
+    def genre_key(self, key_id: int) -> str:
+        return self.genre_keys.values[key_id]
+
+
+CATALOG = Catalog()
@@ -1 +1,4 @@
 global_users_amount = 0
+# bcrypt work factor (log2 of the hashing rounds) and worker threads used for hashing
+bcrypt_rounds = 12
+bcrypt_workers = None
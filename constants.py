@@ -1,4 +1,7 @@
 MAIN_MENU_MESSAGE = "Enter 1 to login or 2 to signup, 3 to exit: "
 USER_MENU_MESSAGE = ("Enter 1 to add movies, 2 to show stats, 3 to get movie recommendations,\n "
                      "4 to tell if your taste is similar to another users', 5 to load from a json file,\n 6 "
-                     "to save to a json file, 7 to change password,\n 8 to exit: ")
\ No newline at end of file
+                     "to save to a json file, 7 to change password,\n 8 to exit, 9 to find all users with a "
+                     "similar taste,\n 10 to get recommendations based on the ranks of all users, 11 to save to a "
+                     "binary file,\n 12 to load from a binary file, 13 to show performance stats, 14 to show your "
+                     "precomputed\n similar users and recommendations, 15 to search your movies by title: ")
\ No newline at end of file
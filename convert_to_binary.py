@@ -0,0 +1,30 @@
+import argparse
+import os
+from typing import Optional
+from Handlers import CLIIOHandler
+from user_movies_table import User_movie_table
+
+
+def convert_json_to_binary(json_path: str, binary_path: Optional[str] = None, handler=CLIIOHandler()) -> Optional[str]:
+    """Converts a table saved by to_json to the binary columnar format and returns the new path.
+    By default the binary directory is placed next to the json file, e.g. user_0_data.json -> user_0_data."""
+    table = User_movie_table.create_from_json(json_path, handler)
+    if table is None:
+        return None
+    return table.to_binary(binary_path or os.path.splitext(json_path)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert user movie json files to the binary columnar format.")
+    parser.add_argument("json_paths", nargs="+", help="user_<id>_data.json files to convert")
+    args = parser.parse_args()
+
+    handler = CLIIOHandler()
+    for json_path in args.json_paths:
+        binary_path = convert_json_to_binary(json_path, handler=handler)
+        if binary_path:
+            handler.display_output(f"{json_path} -> {binary_path}")
+
+
+if __name__ == "__main__":
+    main()
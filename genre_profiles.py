@@ -0,0 +1,163 @@
+from __future__ import annotations
+import itertools
+import threading
+import weakref
+from typing import List
+from lazy_imports import lazy_import
+from user_movies_table import Columns, User_movie_table
+from user_registry import UserRegistry
+
+np = lazy_import("numpy")
+
+
+def similar_rows(values: np.ndarray, row: int) -> np.ndarray:
+    """Returns a mask of the rows of a users x genres means matrix that are similar to the given row
+    under the User_movie_table.are_similar rule, the row itself excluded."""
+    present = ~np.isnan(values)
+    target_present = present[row]
+    if not target_present.any():
+        return np.zeros(len(values), dtype=bool)
+    same_genres = (present == target_present).all(axis=1)
+    diff = np.abs(values[:, target_present] - values[row, target_present]).max(axis=1)
+    similar = same_genres & (diff <= Columns.Similarity_Treshold.value)
+    similar[row] = False
+    return similar
+
+
+def _remove_listener(listener) -> None:
+    if listener in User_movie_table.change_listeners:
+        User_movie_table.change_listeners.remove(listener)
+
+
+class GenreProfileMatrix:
+    """Mean rank of every user per genre: one row per user, one column per genre, NaN where a user
+    has no movies of a genre. Rows are recomputed only for tables that changed since the last refresh.
+
+    Refreshed again with the same registry, the matrix doesn't check every user: the tables report
+    their changes, and only the changed users and the users registered since are refreshed."""
+
+    def __init__(self):
+        self._values = np.full((0, 0), np.nan)
+        self._genre_columns = {}
+        self._users = []
+        self._row_by_user_id = {}
+        # (table token, version) each row was computed from, tokens don't keep evicted tables alive
+        self._row_sources = []
+        # Game sessions of a server share one matrix
+        self._lock = threading.Lock()
+        # Registry of the last refresh, and how many of its users it had
+        self._registry = None
+        self._registry_size = 0
+        # Ids of the users whose tables changed since, under their own lock, as loading a table
+        # during a refresh reports a change
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._listener = None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _ensure_capacity(self, rows: int, columns: int) -> None:
+        capacity_rows, capacity_columns = self._values.shape
+        if rows <= capacity_rows and columns <= capacity_columns:
+            return
+        # Grow geometrically so adding users or genres one at a time stays amortized O(1), only the
+        # exceeded dimension grows, or many users would also multiply the genre columns
+        new_rows = max(rows, 2 * capacity_rows, 16) if rows > capacity_rows else capacity_rows
+        new_columns = max(columns, 2 * capacity_columns, 8) if columns > capacity_columns else capacity_columns
+        values = np.full((new_rows, new_columns), np.nan)
+        values[:capacity_rows, :capacity_columns] = self._values
+        self._values = values
+
+    def _genre_column(self, genre: str) -> int:
+        column = self._genre_columns.get(genre)
+        if column is None:
+            column = len(self._genre_columns)
+            self._ensure_capacity(len(self._users), column + 1)
+            self._genre_columns[genre] = column
+        return column
+
+    def _set_row(self, row: int, genre_means: dict) -> None:
+        columns = [self._genre_column(genre) for genre in genre_means]
+        self._values[row, :] = np.nan
+        self._values[row, columns] = list(genre_means.values())
+
+    def _follow_changes(self) -> None:
+        if self._listener is not None:
+            return
+        # The listener doesn't keep the matrix alive, and is removed with it
+        matrix = weakref.ref(self)
+
+        def mark_dirty(table: User_movie_table) -> None:
+            followed = matrix()
+            if followed is not None:
+                with followed._dirty_lock:
+                    followed._dirty.add(table.user_id)
+
+        self._listener = mark_dirty
+        User_movie_table.change_listeners.append(mark_dirty)
+        weakref.finalize(self, _remove_listener, mark_dirty)
+
+    def _take_dirty(self) -> set:
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def refresh(self, users) -> None:
+        """Brings the matrix up to date with the movie tables of the given users. Users without a table
+        have no movies and are skipped, their tables are not created."""
+        with self._lock:
+            if isinstance(users, UserRegistry) and users is self._registry:
+                # A registry only grows, the users registered since the last refresh are the last ones
+                new_users = []
+                if len(users) != self._registry_size:
+                    registered = list(users)
+                    new_users = registered[self._registry_size:]
+                    self._registry_size = len(registered)
+                changed = (users.get_by_id(user_id) for user_id in self._take_dirty())
+                for user in itertools.chain(new_users, changed):
+                    if user is not None:
+                        self._refresh_user(user)
+                return
+            if isinstance(users, UserRegistry):
+                self._follow_changes()
+                self._take_dirty()
+                self._registry, self._registry_size = users, len(users)
+            for user in users:
+                self._refresh_user(user)
+
+    def _refresh_user(self, user) -> None:
+        if not user.has_movies_table:
+            return
+        table = user.movies_table
+        row = self._row_by_user_id.get(user.id)
+        if row is None:
+            row = len(self._users)
+            self._ensure_capacity(row + 1, len(self._genre_columns))
+            self._users.append(user)
+            self._row_sources.append(None)
+            self._row_by_user_id[user.id] = row
+        source = self._row_sources[row]
+        if source == (table._cache_token, table._version):
+            return
+        self._users[row] = user
+        self._set_row(row, table.get_genre_means())
+        self._row_sources[row] = (table._cache_token, table._version)
+
+    def similar_users(self, user) -> List:
+        """Returns every other user whose taste is similar under the User_movie_table.are_similar rule."""
+        with self._lock:
+            row = self._row_by_user_id.get(user.id)
+            if row is None:
+                return []
+            similar = similar_rows(self.values, row)
+            return [self._users[i] for i in np.flatnonzero(similar)]
+
+    @property
+    def values(self) -> np.ndarray:
+        """The users x genres means, rows in the order the users were first refreshed."""
+        return self._values[:len(self._users), :len(self._genre_columns)]
+
+    @property
+    def users(self) -> List:
+        return self._users
@@ -0,0 +1,113 @@
+import bisect
+import cProfile
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# Upper bounds (in milliseconds) of the latency histogram buckets, the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class _OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, seconds: float, rows: int) -> None:
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, seconds * 1000)] += 1
+
+    def histogram_str(self) -> str:
+        labels = [f"<{bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, self.histogram) if count)
+
+
+class Instrumentation:
+    """Opt-in latency, call count and rows touched per operation, with an optional cProfile capture.
+
+    Operations are recorded by functions decorated with `timed`, which cost a flag check while
+    instrumentation is off."""
+
+    enabled = False
+    _stats: Dict[str, _OperationStats] = {}
+    _lock = threading.Lock()
+    _profiler: Optional[cProfile.Profile] = None
+
+    @classmethod
+    def enable(cls, profile: bool = False) -> None:
+        cls.enabled = True
+        if profile and cls._profiler is None:
+            cls._profiler = cProfile.Profile()
+            cls._profiler.enable()
+
+    @classmethod
+    def disable(cls) -> None:
+        cls.enabled = False
+        if cls._profiler is not None:
+            cls._profiler.disable()
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._stats = {}
+
+    @classmethod
+    def record(cls, name: str, seconds: float, rows: int = 0) -> None:
+        with cls._lock:
+            stats = cls._stats.get(name)
+            if stats is None:
+                stats = cls._stats[name] = _OperationStats()
+            stats.add(seconds, rows)
+
+    @classmethod
+    def get_stats(cls, name: str) -> Optional[_OperationStats]:
+        return cls._stats.get(name)
+
+    @classmethod
+    def report(cls) -> List[str]:
+        """Returns a line per recorded operation, the most expensive first."""
+        with cls._lock:
+            items = sorted(cls._stats.items(), key=lambda item: item[1].total_seconds, reverse=True)
+        return [f"{name}: calls={stats.calls} total={stats.total_seconds * 1000:.3f}ms "
+                f"mean={stats.total_seconds / stats.calls * 1000:.3f}ms max={stats.max_seconds * 1000:.3f}ms "
+                f"rows={stats.rows} [{stats.histogram_str()}]" for name, stats in items]
+
+    @classmethod
+    def dump_profile(cls, path: str) -> bool:
+        """Writes the captured cProfile data to path (readable with pstats), returns False if none was captured."""
+        if cls._profiler is None:
+            return False
+        cls._profiler.disable()
+        cls._profiler.dump_stats(path)
+        if cls.enabled:
+            cls._profiler.enable()
+        return True
+
+
+def timed(function: Callable = None, *, name: str = None, rows: Callable = None):
+    """Records the calls of the decorated function while instrumentation is enabled.
+
+    rows, if given, is called with the result followed by the call's arguments and returns the
+    amount of rows the call touched."""
+    if function is None:
+        return functools.partial(timed, name=name, rows=rows)
+    operation_name = name or function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not Instrumentation.enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        Instrumentation.record(operation_name, seconds, rows(result, *args, **kwargs) if rows else 0)
+        return result
+
+    return wrapper
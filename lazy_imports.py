@@ -0,0 +1,26 @@
+import importlib
+
+
+class LazyModule:
+    """Stands in for a module and imports it on the first attribute access.
+
+    Keeps heavy dependencies (pandas, numpy, bcrypt...) off the startup path of the game, they are
+    imported by the first operation that actually uses them."""
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attribute: str):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self._name)
+        return getattr(module, attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__['_module'] is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
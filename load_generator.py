@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import time
+import uuid
+from typing import List
+from Handlers import INPUT_MARKER
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+PASSWORD = "LoadTest123!"
+GENRES = ["Drama", "Comedy", "Action", "Sci-Fi", "Romance"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _read_until_prompt(reader: asyncio.StreamReader) -> List[str]:
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            return lines
+        line = line.decode().rstrip("\n")
+        if line == INPUT_MARKER:
+            return lines
+        lines.append(line)
+
+
+async def run_session(host: str, port: int, movies: int, latencies: List[float]) -> None:
+    """Signs up a new user, adds movies, asks for stats and similar users, then logs out and exits."""
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def command(text: str) -> List[str]:
+        start = time.perf_counter()
+        writer.write((text + "\n").encode())
+        await writer.drain()
+        lines = await _read_until_prompt(reader)
+        latencies.append(time.perf_counter() - start)
+        return lines
+
+    try:
+        await _read_until_prompt(reader)
+        for text in ["2", f"load_{uuid.uuid4().hex[:12]}", PASSWORD, "1"]:
+            await command(text)
+        for i in range(movies):
+            await command(f"Movie {i}")
+            await command(str(i % 10 + 1))
+            await command(GENRES[i % len(GENRES)])
+        for text in ["quit", "2", "9", "8", "3"]:
+            await command(text)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_load(host: str, port: int, sessions: int, concurrency: int, movies: int) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_session():
+        async with semaphore:
+            await run_session(host, port, movies, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited_session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "commands": len(latencies),
+        "seconds": round(elapsed, 3),
+        "sessions_per_sec": round(sessions / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput and latency of server.py.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--movies", type=int, default=10, help="movies added by every session")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args.host, args.port, args.sessions, args.concurrency, args.movies))
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
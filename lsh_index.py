@@ -0,0 +1,223 @@
+import argparse
+import random
+import threading
+import time
+import zlib
+from typing import List, Optional
+from genre_profiles import GenreProfileMatrix
+from lazy_imports import lazy_import
+from user_movies_table import User_movie_table, Columns
+from user_registry import UserRegistry
+from users import User, NO_PASSWORD
+
+np = lazy_import("numpy")
+
+DEFAULT_HASH_TABLES = 10
+DEFAULT_PROJECTIONS = 4
+DEFAULT_BUCKET_WIDTH = 4.0
+DEFAULT_SEED = 1507
+
+
+class GenreLSHIndex:
+    """Approximate similar users search over the genre means of the users' tables.
+
+    Users only match users with the same genres, so every bucket key starts with the genre set.
+    Inside it the genre means vector is hashed by `hash_tables` random projection hashes, each
+    quantizing `projections` random projections into cells of `bucket_width`. A query checks the
+    users sharing a bucket with the exact are_similar rule, so it never returns a false match but
+    may miss one (see recall_report).
+
+    Once attached to a registry, the tables report their changes and only the changed users are
+    rehashed, on the next query."""
+
+    def __init__(self, hash_tables: int = DEFAULT_HASH_TABLES, projections: int = DEFAULT_PROJECTIONS,
+                 bucket_width: float = DEFAULT_BUCKET_WIDTH, seed: int = DEFAULT_SEED):
+        self.hash_tables = hash_tables
+        self.projections = projections
+        self.bucket_width = bucket_width
+        self.seed = seed
+        self.candidates_checked = 0
+        self._offsets = np.random.default_rng(seed).uniform(0, bucket_width, hash_tables * projections)
+        self._genre_directions = {}
+        # bucket key -> ids of the users in the bucket
+        self._buckets = {}
+        # user id -> (table token, version, genre means, bucket keys)
+        self._entries = {}
+        self._dirty = set()
+        self._users = None
+        # Reentrant, as loading an evicted table while indexing reports a change through _mark_dirty
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def attach(self, users: UserRegistry) -> None:
+        """Indexes the users and follows the changes of their tables."""
+        self._users = users
+        User_movie_table.change_listeners.append(self._mark_dirty)
+        with self._lock:
+            for user in users:
+                # Users without a table have no movies yet
+                if user.has_movies_table:
+                    self._update(user)
+
+    def detach(self) -> None:
+        if self._mark_dirty in User_movie_table.change_listeners:
+            User_movie_table.change_listeners.remove(self._mark_dirty)
+        self._users = None
+
+    def _mark_dirty(self, table: User_movie_table) -> None:
+        with self._lock:
+            self._dirty.add(table.user_id)
+
+    def _direction(self, genre: str):
+        direction = self._genre_directions.get(genre)
+        if direction is None:
+            # Seeded by the genre, so a genre gets the same direction in every process
+            rng = np.random.default_rng([self.seed, zlib.crc32(genre.encode())])
+            direction = rng.standard_normal(self.hash_tables * self.projections)
+            self._genre_directions[genre] = direction
+        return direction
+
+    def _bucket_keys(self, genre_means: dict) -> List[tuple]:
+        projection = self._offsets.copy()
+        for genre, mean in genre_means.items():
+            projection += mean * self._direction(genre)
+        cells = np.floor(projection / self.bucket_width).astype(np.int64)
+        genres = frozenset(genre_means)
+        return [(hash_table, genres, tuple(row))
+                for hash_table, row in enumerate(cells.reshape(self.hash_tables, self.projections).tolist())]
+
+    def _remove(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        for key in entry[3]:
+            bucket = self._buckets[key]
+            bucket.discard(user_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def _update(self, user: User) -> None:
+        self._remove(user.id)
+        table = user.movies_table
+        genre_means = table.get_genre_means()
+        keys = self._bucket_keys(genre_means) if genre_means else []
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(user.id)
+        self._entries[user.id] = (table._cache_token, table._version, genre_means, keys)
+
+    def _apply_changes(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        for user_id in dirty:
+            # Changes are reported by table, the user's current table is the one indexed
+            user = self._users.get_by_id(user_id) if self._users is not None else None
+            if user is None:
+                self._remove(user_id)
+            else:
+                self._update(user)
+
+    def _current_entry(self, user: User) -> tuple:
+        entry = self._entries.get(user.id)
+        table = user._movies_table if entry is not None and user.table_store is not None else user.movies_table
+        # A table may have changed before the index was attached, an evicted table is up to date as
+        # its changes were reported before
+        if entry is None or (table is not None and (entry[0] != table._cache_token or entry[1] != table._version)):
+            self._update(user)
+            entry = self._entries[user.id]
+        return entry
+
+    def similar_users(self, user: User) -> List[User]:
+        """Returns the other users whose taste is similar under the are_similar rule, ordered by id."""
+        with self._lock:
+            self._apply_changes()
+            _, _, genre_means, keys = self._current_entry(user)
+            candidates = set()
+            for key in keys:
+                candidates.update(self._buckets[key])
+            candidates.discard(user.id)
+            self.candidates_checked += len(candidates)
+            similar = [candidate for candidate in map(self._users.get_by_id, candidates)
+                       if self._is_similar(genre_means, self._current_entry(candidate)[2])]
+        return sorted(similar, key=lambda other: other.id)
+
+    @staticmethod
+    def _is_similar(first_means: dict, second_means: dict) -> bool:
+        if first_means.keys() != second_means.keys():
+            return False
+        diff = max(abs(mean - second_means[genre]) for genre, mean in first_means.items())
+        return diff <= Columns.Similarity_Treshold.value
+
+
+def recall_report(users: UserRegistry, index: Optional[GenreLSHIndex] = None) -> dict:
+    """Compares the similar users found by the index with the exact GenreProfileMatrix search."""
+    if index is None:
+        index = GenreLSHIndex()
+        index.attach(users)
+    matrix = GenreProfileMatrix()
+    matrix.refresh(users)
+
+    exact_seconds = approximate_seconds = 0.0
+    exact_pairs = found_pairs = 0
+    checked_before = index.candidates_checked
+    queries = 0
+    for user in users:
+        if user._movies_table is None or not user._movies_table._stats.count:
+            continue
+        queries += 1
+        start = time.perf_counter()
+        exact = matrix.similar_users(user)
+        exact_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        found = index.similar_users(user)
+        approximate_seconds += time.perf_counter() - start
+        exact_pairs += len(exact)
+        found_pairs += len({other.id for other in exact} & {other.id for other in found})
+
+    return {
+        "users": len(users),
+        "queries": queries,
+        "exact_pairs": exact_pairs,
+        "found_pairs": found_pairs,
+        "recall": found_pairs / exact_pairs if exact_pairs else 1.0,
+        "mean_candidates": (index.candidates_checked - checked_before) / queries if queries else 0.0,
+        "exact_ms_per_query": exact_seconds / queries * 1000 if queries else 0.0,
+        "lsh_ms_per_query": approximate_seconds / queries * 1000 if queries else 0.0,
+    }
+
+
+def generate_users(count: int, genres: int, seed: int) -> UserRegistry:
+    """Returns users rating 1-6 movies of 1-2 genres, so some of them have a similar taste."""
+    rng = random.Random(seed)
+    genre_names = [f"Genre {i}" for i in range(genres)]
+    users = UserRegistry()
+    for user_id in range(count):
+        user = User(f"user{user_id}", user_id, password_hash=NO_PASSWORD)
+        user_genres = rng.sample(genre_names, rng.randint(1, 2))
+        user.movies_table.add_movies((f"Movie {i}", rng.randint(1, 10), rng.choice(user_genres))
+                                     for i in range(rng.randint(1, 6)))
+        users.add(user)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of the LSH similar users index against the exact search.")
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--hash-tables", type=int, default=DEFAULT_HASH_TABLES)
+    parser.add_argument("--projections", type=int, default=DEFAULT_PROJECTIONS)
+    parser.add_argument("--bucket-width", type=float, default=DEFAULT_BUCKET_WIDTH)
+    args = parser.parse_args()
+
+    users = generate_users(args.users, args.genres, args.seed)
+    index = GenreLSHIndex(args.hash_tables, args.projections, args.bucket_width, args.seed)
+    index.attach(users)
+    report = recall_report(users, index)
+    index.detach()
+    for name, value in report.items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
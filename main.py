@@ -1,9 +1,84 @@
+import argparse
+import os
+import sys
+import tempfile
 from Game import Game
 from Handlers import CLIIOHandler
+from bulk_import import import_ratings, DEFAULT_CHUNK_SIZE
+from instrumentation import Instrumentation
+from lsh_index import GenreLSHIndex
+from batch_precompute import PrecomputedResults
+from batch_mode import replay_script
+from users import Authentication
+from table_store import TableStore
+from storage_engine import open_storage, DEFAULT_SNAPSHOT_EVERY
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Movies recommendation game.")
+    parser.add_argument("--import-ratings", metavar="PATH",
+                        help="seed the users from a CSV or JSONL ratings dump before showing the menu")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows read at a time by --import-ratings")
+    parser.add_argument("--data-dir", metavar="PATH",
+                        help="keep the users and their movies in this directory across restarts")
+    parser.add_argument("--snapshot-every", type=int, default=DEFAULT_SNAPSHOT_EVERY,
+                        help="changes logged in --data-dir between two snapshots")
+    parser.add_argument("--instrument", action="store_true",
+                        help="record the latency of every command and print the stats on exit")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="also capture a cProfile of the session and save it to PATH")
+    parser.add_argument("--lsh", action="store_true",
+                        help="find users with a similar taste with the approximate LSH index")
+    parser.add_argument("--precomputed", metavar="PATH",
+                        help="serve the results of batch_precompute.py saved in PATH")
+    parser.add_argument("--script", metavar="PATH",
+                        help="play the JSONL script in PATH instead of asking for input, see batch_mode.py")
+    parser.add_argument("--bcrypt-rounds", type=int, help="bcrypt work factor of new passwords")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="keep at most this much movie data in memory, the rest in files under --data-dir")
+    return parser.parse_args()
+
 
 def main():
-    game = Game(CLIIOHandler())
-    game.show_main_menu()
+    args = parse_args()
+    if args.instrument or args.profile:
+        Instrumentation.enable(profile=bool(args.profile))
+    if args.bcrypt_rounds:
+        Authentication.configure(rounds=args.bcrypt_rounds)
+    table_store = None
+    if args.memory_budget:
+        tables_directory = os.path.join(args.data_dir, "tables") if args.data_dir else tempfile.mkdtemp()
+        table_store = TableStore(tables_directory, int(args.memory_budget * 1024 * 1024))
+    storage, users = open_storage(args.data_dir, args.snapshot_every, table_store)
+    similarity_index = None
+    if args.lsh:
+        similarity_index = GenreLSHIndex()
+        similarity_index.attach(users)
+    precomputed = PrecomputedResults.load(args.precomputed) if args.precomputed else None
+    game_options = dict(storage=storage, similarity_index=similarity_index, precomputed=precomputed)
+    game = Game(CLIIOHandler(), users=users, **game_options)
+    if args.import_ratings:
+        import_ratings(game, args.import_ratings, args.chunk_size)
+    try:
+        if args.script:
+            summary = replay_script(args.script, users, sys.stdout, **game_options)
+            game.handler.display_output(
+                f"Replayed {summary.inputs} inputs in {summary.seconds:.2f}s "
+                f"({summary.inputs / max(summary.seconds, 1e-9):.0f} inputs/s), "
+                f"{len(summary.mismatches)} expectations not met")
+            for line_number, expected in summary.mismatches:
+                game.handler.display_output(f"  line {line_number}: expected {expected!r}")
+        else:
+            game.show_main_menu()
+    finally:
+        if storage is not None:
+            storage.close(snapshot=True)
+        if Instrumentation.enabled:
+            for line in Instrumentation.report():
+                game.handler.display_output(line)
+        if args.profile:
+            Instrumentation.dump_profile(args.profile)
 
 
 if __name__ == "__main__":
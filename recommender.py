@@ -0,0 +1,120 @@
+from __future__ import annotations
+import threading
+from typing import List, Tuple
+from lazy_imports import lazy_import
+from catalog import CATALOG
+
+np = lazy_import("numpy")
+
+RECOMMENDATIONS_AMOUNT = 5
+
+
+class ItemBasedRecommender:
+    """Item-based collaborative filtering over the movie tables of all users.
+
+    Ratings are kept as a CSR user x movie matrix (indptr, indices, data). The cosine similarity of two
+    movies is the product of their rating columns over the product of the columns' norms, so the
+    predicted rank of every movie for a user is two sparse products over the ratings,
+    R.T @ (R @ (ranks / norms)) over R.T @ (R @ (1 / norms)), and no movie x movie matrix is built."""
+
+    def __init__(self):
+        self._sources = None
+        self._row_by_user_id = {}
+        # user id -> (table token, version, title ids, ranks) of the rows last read from the user's table
+        self._user_rows = {}
+        self.movie_names = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float64)
+        self.norms = np.zeros(0, dtype=np.float64)
+        # Row of every stored rating, the CSR indptr expanded
+        self._rows = np.zeros(0, dtype=np.int64)
+        # Game sessions of a server share one recommender
+        self._lock = threading.Lock()
+
+    def refresh(self, users) -> None:
+        """Rebuilds the model if any of the users' movie tables changed since the last build. Users
+        without a table have no ratings and are skipped, their tables are not created."""
+        users = [user for user in users if user.has_movies_table]
+        # Every table is got once, with a table store getting it may load it and evict another
+        tables = [user.movies_table for user in users]
+        # Table tokens rather than the tables, so evicted tables are not kept alive
+        sources = [(user.id, table._cache_token, table._version) for user, table in zip(users, tables)]
+        with self._lock:
+            if sources == self._sources:
+                return
+            self.fit(users, tables)
+            self._sources = sources
+
+    def _read_rows(self, user_id: int, table) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._user_rows.get(user_id)
+        if cached is not None and cached[:2] == (table._cache_token, table._version):
+            return cached[2:]
+        title_ids, ranks, _ = table.columns()
+        self._user_rows[user_id] = (table._cache_token, table._version, title_ids, ranks)
+        return title_ids, ranks
+
+    def fit(self, users, tables=None) -> None:
+        if tables is None:
+            tables = [user.movies_table for user in users]
+        # Only the tables that changed since the last build are read again, the rest is one concatenation
+        rows = [self._read_rows(user.id, table) for user, table in zip(users, tables)]
+        user_ids = [user.id for user in users]
+        for user_id in self._user_rows.keys() - set(user_ids):
+            del self._user_rows[user_id]
+        self._row_by_user_id = {user_id: row for row, user_id in enumerate(user_ids)}
+        counts = np.array([len(title_ids) for title_ids, _ in rows], dtype=np.int64)
+        self.indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        title_ids = np.concatenate([title_ids for title_ids, _ in rows]) if rows else np.zeros(0, dtype=np.int32)
+        self.data = (np.concatenate([ranks.astype(np.float64) for _, ranks in rows]) if rows
+                     else np.zeros(0, dtype=np.float64))
+
+        # A column per normalized title, so every spelling of a movie is one movie, in the order the
+        # movies were first rated and named with their first spelling
+        _, first_positions, columns = np.unique(CATALOG.title_keys_of(title_ids), return_index=True,
+                                                return_inverse=True)
+        order = np.argsort(first_positions, kind='stable')
+        column_of_distinct = np.empty(len(order), dtype=np.int32)
+        column_of_distinct[order] = np.arange(len(order), dtype=np.int32)
+        self.indices = column_of_distinct[columns]
+        self.movie_names = CATALOG.titles_of(title_ids[first_positions[order]]).tolist()
+        self._rows = np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+        self.norms = np.sqrt(np.bincount(self.indices, weights=self.data ** 2, minlength=len(self.movie_names)))
+        self.norms[self.norms == 0] = 1
+
+    def _similarity_sums(self, weights: np.ndarray) -> np.ndarray:
+        """Returns R.T @ (R @ weights), the products of every movie's ratings with the weighted movies'."""
+        per_user = np.bincount(self._rows, weights=self.data * weights[self.indices], minlength=len(self.indptr) - 1)
+        return np.bincount(self.indices, weights=self.data * per_user[self._rows], minlength=len(self.movie_names))
+
+    def recommend(self, user, amount: int = RECOMMENDATIONS_AMOUNT) -> List[Tuple[str, float]]:
+        """Returns up to `amount` (movie name, predicted rank) pairs of movies the user hasn't ranked."""
+        with self._lock:
+            return self._recommend(user, amount)
+
+    def _recommend(self, user, amount: int) -> List[Tuple[str, float]]:
+        row = self._row_by_user_id.get(user.id)
+        if row is None:
+            return []
+        begin, end = self.indptr[row], self.indptr[row + 1]
+        seen, ranks = self.indices[begin:end], self.data[begin:end]
+        if not len(seen):
+            return []
+
+        # The norm of the scored movie divides both sums, so only the seen movies' norms are needed
+        inverse_norms = np.zeros(len(self.movie_names))
+        inverse_norms[seen] = 1 / self.norms[seen]
+        weights = self._similarity_sums(inverse_norms)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = self._similarity_sums(inverse_norms * np.bincount(seen, weights=ranks,
+                                                                       minlength=len(self.movie_names))) / weights
+        scores[weights <= 0] = -np.inf
+        scores[seen] = -np.inf
+
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if len(candidates) > amount:
+            candidates = np.sort(candidates[np.argpartition(-scores[candidates], amount - 1)[:amount]])
+        # Stable sort keeps equal scores in the order the movies were first seen
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.movie_names[i], round(float(scores[i]), 2)) for i in candidates]
@@ -0,0 +1,85 @@
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable, Tuple
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# Tokens that tell tables apart in the cache keys, unlike id() they are never reused
+_table_tokens = itertools.count()
+
+
+def new_table_token() -> int:
+    return next(_table_tokens)
+
+
+class ResultCache:
+    """Bounded LRU cache of query results keyed by the tables they were computed from.
+
+    A key holds the token and the version of every table, so a change of a table makes its old
+    entries unreachable. Those entries are dropped by invalidate(), which the tables call on their
+    first change after being cached."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # table token -> keys of the entries computed from the table
+        self._keys_by_table = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, kind: str, tables: Iterable, compute: Callable, *arguments: Hashable):
+        """Returns the cached result of the query, computing it with compute() on a miss."""
+        tables = tuple(tables)
+        key = (kind, tuple((table._cache_token, table._version) for table in tables)) + arguments
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        result = compute()
+
+        with self._lock:
+            self._entries[key] = result
+            for table in tables:
+                self._keys_by_table.setdefault(table._cache_token, set()).add(key)
+                table._cached = True
+            while len(self._entries) > self.max_entries:
+                self._forget(self._entries.popitem(last=False)[0])
+        return result
+
+    def _forget(self, key: Tuple) -> None:
+        for token, _ in key[1]:
+            keys = self._keys_by_table.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[token]
+
+    def invalidate(self, table) -> None:
+        """Drops every entry computed from the table."""
+        with self._lock:
+            table._cached = False
+            for key in self._keys_by_table.pop(table._cache_token, ()):
+                self._entries.pop(key, None)
+                self._forget(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "max_entries": self.max_entries}
+
+
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from Game import Game
+from genre_profiles import GenreProfileMatrix
+from Handlers import AsyncStreamIOHandler
+from recommender import ItemBasedRecommender
+from users import Authentication
+from user_registry import UserRegistry
+from storage_engine import StorageEngine, open_storage
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_SESSIONS = 256
+
+
+class GameServer:
+    """Serves a Game per TCP connection, all sessions sharing one registry of users and the models
+    built over them.
+
+    Every Game runs its blocking loop in a worker thread of the server, while the event loop does
+    the network IO of all of them."""
+
+    def __init__(self, users: UserRegistry = None, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 storage: StorageEngine = None):
+        self.users = users if users is not None else UserRegistry()
+        self.storage = storage
+        self.genre_profiles = GenreProfileMatrix()
+        self.recommender = ItemBasedRecommender()
+        self._executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix="session")
+        self.sessions = 0
+
+    async def handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        game = Game(AsyncStreamIOHandler(reader, writer, loop), users=self.users, storage=self.storage,
+                    genre_profiles=self.genre_profiles, recommender=self.recommender)
+        self.sessions += 1
+        try:
+            await loop.run_in_executor(self._executor, game.show_main_menu)
+        except EOFError:
+            pass
+        finally:
+            self.sessions -= 1
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_session, host, port)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(host: str, port: int, max_sessions: int, data_dir: str = None) -> None:
+    storage, users = open_storage(data_dir)
+    game_server = GameServer(users, max_sessions, storage)
+    server = await game_server.start(host, port)
+    print(f"Serving on {', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.shutdown()
+        if storage is not None:
+            storage.close(snapshot=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the movies recommendation game over TCP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS,
+                        help="sessions served at the same time, later connections wait for a free slot")
+    parser.add_argument("--data-dir", help="keep the users and their movies in this directory across restarts")
+    parser.add_argument("--bcrypt-rounds", type=int, help="bcrypt work factor of new passwords")
+    args = parser.parse_args()
+
+    if args.bcrypt_rounds:
+        Authentication.configure(rounds=args.bcrypt_rounds)
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_sessions, args.data_dir))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import subprocess
+import sys
+from typing import List, NamedTuple, Tuple
+
+# Dependencies that must not be imported before the first operation that needs them
+HEAVY_MODULES = ("pandas", "numpy", "bcrypt", "colorama", "asyncio")
+DEFAULT_BUDGET_MS = 150
+
+
+class StartupReport(NamedTuple):
+    total_ms: float
+    slowest: List[Tuple[str, float]]
+    heavy_modules_loaded: List[str]
+
+
+def measure_startup(module: str = "main", top: int = 10) -> StartupReport:
+    """Imports module in a fresh interpreter with -X importtime and reports what the import cost."""
+    code = (f"import sys, {module}; "
+            f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    total_us = 0
+    cumulative = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        cumulative.append((name.strip(), int(cumulative_us) / 1000))
+        # Top level imports are not indented, their cumulative times add up to the whole startup
+        if not name.startswith("  "):
+            total_us += int(cumulative_us)
+    cumulative.sort(key=lambda item: item[1], reverse=True)
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return StartupReport(total_us / 1000, cumulative[:top], loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the game starts without its heavy dependencies.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    report = measure_startup(args.module)
+    print(f"Importing {args.module} took {report.total_ms:.1f} ms (budget {args.budget_ms} ms)")
+    for name, milliseconds in report.slowest:
+        print(f"  {milliseconds:8.1f} ms  {name}")
+    if report.heavy_modules_loaded:
+        print(f"Imported eagerly: {', '.join(report.heavy_modules_loaded)}")
+    if report.heavy_modules_loaded or report.total_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
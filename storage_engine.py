@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+from typing import Optional
+from user_movies_table import User_movie_table
+from user_registry import UserRegistry
+from users import User
+from table_store import TableStore
+
+LOG_FILE = "changes.log"
+SNAPSHOT_FILE = "snapshot.json"
+DEFAULT_SNAPSHOT_EVERY = 10_000
+# Attempts of a read-only load racing with the game's snapshots
+_READ_ONLY_ATTEMPTS = 5
+
+
+class _SnapshotChanged(Exception):
+    """The log no longer follows the snapshot that was read, the game took a new snapshot meanwhile."""
+
+
+def _table_rows(table: User_movie_table) -> list:
+    return [list(row) for row in table.iter_rows()]
+
+
+class StorageEngine:
+    """Durable storage of the users and their movies: an append-only log of every change, compacted
+    into a snapshot every `snapshot_every` changes.
+
+    Changes are buffered and written to the log by commit(), so saving costs O(changes). On load the
+    snapshot is read and the log records that came after it are replayed."""
+
+    def __init__(self, directory: str, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY, fsync: bool = True):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.registry = None
+        self._log_path = os.path.join(directory, LOG_FILE)
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._lock = threading.RLock()
+        self._log = None
+        self._sequence = 0
+        self._changes_since_snapshot = 0
+
+    # --- Loading ---
+
+    def load(self, table_store: Optional[TableStore] = None, read_only: bool = False) -> UserRegistry:
+        """Rebuilds the users from the snapshot and the log, and starts logging their changes.
+
+        With a table store the rebuilt tables are kept within its memory budget, its files are
+        rebuilt from the snapshot and the log. A read-only load leaves the files untouched and logs
+        nothing, so it can read the data directory of a running game: a record the game is still
+        writing is skipped, and the load starts over if the game takes a snapshot meanwhile."""
+        if not read_only:
+            return self._load(table_store, read_only)
+        for attempt in range(_READ_ONLY_ATTEMPTS):
+            try:
+                return self._load(table_store, read_only)
+            except _SnapshotChanged:
+                if attempt == _READ_ONLY_ATTEMPTS - 1:
+                    raise RuntimeError(f"The snapshot in {self.directory} kept changing while it was read")
+
+    def _load(self, table_store: Optional[TableStore], read_only: bool) -> UserRegistry:
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        registry = UserRegistry()
+        if table_store is not None:
+            table_store.clear()
+            registry.attach_table_store(table_store)
+        snapshot_sequence = 0
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "r") as file:
+                snapshot = json.load(file)
+            snapshot_sequence = snapshot["sequence"]
+            for record in snapshot["users"]:
+                user = User(record["user_name"], record["user_id"], password_hash=record["password_hash"].encode())
+                registry.add(user)
+                if record["movies"]:
+                    user.movies_table.add_movies(record["movies"])
+
+        self._sequence = snapshot_sequence
+        if os.path.exists(self._log_path):
+            valid_length = 0
+            with open(self._log_path, "rb") as file:
+                for line in file:
+                    if read_only and not line.endswith(b"\n"):
+                        # Being written by the game
+                        break
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line of a crash, its change was never committed
+                        break
+                    valid_length += len(line)
+                    if record["sequence"] <= snapshot_sequence:
+                        continue
+                    if read_only and record["sequence"] != self._sequence + 1:
+                        raise _SnapshotChanged()
+                    self._apply(registry, record)
+                    self._sequence = record["sequence"]
+                    self._changes_since_snapshot += 1
+            if not read_only:
+                # New records must not be appended to the torn line
+                os.truncate(self._log_path, valid_length)
+
+        self.registry = registry
+        if read_only:
+            return registry
+        self._log = open(self._log_path, "a")
+        registry.attach_journal(self)
+        return registry
+
+    @staticmethod
+    def _apply(registry: UserRegistry, record: dict) -> None:
+        operation = record["operation"]
+        if operation == "signup":
+            registry.add(User(record["user_name"], record["user_id"],
+                              password_hash=record["password_hash"].encode()))
+            return
+        user = registry.get_by_id(record["user_id"])
+        if operation == "rating":
+            user.movies_table.add_movie(record["name"], record["rank"], record["genre"])
+        elif operation == "removal":
+            user.movies_table.remove_movie(record["name"])
+        elif operation == "table_replaced":
+            table = User_movie_table(user.id)
+            table.add_movies(record["movies"])
+            user.movies_table = table
+        elif operation == "password_change":
+            user.password = record["password_hash"].encode()
+
+    # --- Logging, called by the users, their tables and the registry ---
+
+    def _write(self, record: dict) -> None:
+        with self._lock:
+            self._sequence += 1
+            record["sequence"] = self._sequence
+            self._log.write(json.dumps(record) + "\n")
+            self._changes_since_snapshot += 1
+
+    def log_signup(self, user: User) -> None:
+        self._write({"operation": "signup", "user_id": user.id, "user_name": user.user_name,
+                     "password_hash": user.password.decode()})
+        if user._movies_table is not None and user._movies_table._stats.count:
+            self.log_table_replaced(user.id, user._movies_table)
+
+    def log_rating(self, user_id: int, name: str, rank, genre: str) -> None:
+        self._write({"operation": "rating", "user_id": user_id, "name": name, "rank": rank, "genre": genre})
+
+    def log_removal(self, user_id: int, name: str) -> None:
+        self._write({"operation": "removal", "user_id": user_id, "name": name})
+
+    def log_table_replaced(self, user_id: int, table: User_movie_table) -> None:
+        self._write({"operation": "table_replaced", "user_id": user_id, "movies": _table_rows(table)})
+
+    def log_password_change(self, user_id: int, password_hash: bytes) -> None:
+        self._write({"operation": "password_change", "user_id": user_id, "password_hash": password_hash.decode()})
+
+    # --- Durability ---
+
+    def commit(self) -> None:
+        """Makes the logged changes durable, and compacts them into a snapshot when enough piled up."""
+        with self._lock:
+            if self._log is None:
+                return
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            if self._changes_since_snapshot >= self.snapshot_every:
+                self.snapshot()
+
+    def snapshot(self) -> None:
+        """Writes all the users to a new snapshot and empties the log."""
+        with self._lock:
+            self._log.flush()
+            users = [{
+                "user_id": user.id,
+                "user_name": user.user_name,
+                "password_hash": user.password.decode(),
+                "movies": self._snapshot_rows(user)
+            } for user in self.registry]
+            temporary_path = self._snapshot_path + ".tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"sequence": self._sequence, "users": users}, file, separators=(",", ":"))
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            os.replace(temporary_path, self._snapshot_path)
+            # Records up to the snapshot's sequence are skipped on load, so a crash before the
+            # truncation below loses nothing
+            self._log.close()
+            self._log = open(self._log_path, "w")
+            self._changes_since_snapshot = 0
+
+    @staticmethod
+    def _snapshot_rows(user: User) -> list:
+        table = user._movies_table
+        if table is None and user.table_store is not None:
+            # Evicted, read from its file without loading it
+            table = user.table_store.read(user.id)
+        return _table_rows(table) if table is not None else []
+
+    def close(self, snapshot: bool = False) -> None:
+        with self._lock:
+            if self._log is None:
+                return
+            if snapshot:
+                self.snapshot()
+            self.commit()
+            self._log.close()
+            self._log = None
+
+
+def open_storage(directory: Optional[str], snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+                 table_store: Optional[TableStore] = None, read_only: bool = False):
+    """Returns (storage, users) for a data directory, or (None, a new empty registry) without one.
+
+    See StorageEngine.load for read_only."""
+    if not directory:
+        users = UserRegistry()
+        if table_store is not None:
+            table_store.clear()
+            users.attach_table_store(table_store)
+        return None, users
+    storage = StorageEngine(directory, snapshot_every)
+    return storage, storage.load(table_store, read_only)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Optional
+from result_cache import RESULT_CACHE
+from user_movies_table import User_movie_table, BINARY_PREVIOUS_SUFFIX
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+class TableStore:
+    """Keeps the movie tables of the users in memory up to a memory budget, the rest in files.
+
+    A user's table is loaded from its file (in the binary format of User_movie_table.to_binary) on
+    first access, and the least recently used tables are evicted while the loaded ones take more
+    than memory_budget bytes. A table that changed since it was loaded is written to its file when
+    evicted. Tables in use by a session are pinned and never evicted."""
+
+    def __init__(self, directory: str, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.loads = 0
+        self.evictions = 0
+        self.writes = 0
+        # user id -> (user, version of the table when it was loaded or last written), least recent first
+        self._loaded = OrderedDict()
+        self._pins = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._loaded)
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"user_{user_id}")
+
+    def clear(self) -> None:
+        """Deletes the files of all tables, e.g. before the tables are rebuilt from storage."""
+        with self._lock:
+            for entry in os.listdir(self.directory):
+                if entry.startswith("user_"):
+                    shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def has_file(self, user_id: int) -> bool:
+        """Tells if the user's table was saved to a file, a write being swapped in included."""
+        path = self._path(user_id)
+        return os.path.exists(path) or os.path.exists(path + BINARY_PREVIOUS_SUFFIX)
+
+    def read(self, user_id: int) -> Optional[User_movie_table]:
+        """Returns the table saved in the user's file without loading it into the store, or None."""
+        if not self.has_file(user_id):
+            return None
+        return User_movie_table.create_from_binary(self._path(user_id))
+
+    def load(self, user) -> User_movie_table:
+        """Loads the user's table, from its file if it has one, and evicts tables over the budget."""
+        with self._lock:
+            if user._movies_table is not None:
+                self.touch(user)
+                return user._movies_table
+            table = self.read(user.id)
+            saved_version = None
+            if table is None:
+                table = User_movie_table(user.id)
+            else:
+                saved_version = table._version
+                self.loads += 1
+            table.journal = user.journal
+            user._movies_table = table
+            self._loaded[user.id] = (user, saved_version)
+            self._enforce_budget()
+            return table
+
+    def adopt(self, user) -> None:
+        """Starts managing a table that was set on the user directly."""
+        with self._lock:
+            self._loaded[user.id] = (user, None)
+            self._loaded.move_to_end(user.id)
+            self._enforce_budget()
+
+    def touch(self, user) -> None:
+        with self._lock:
+            if user.id in self._loaded:
+                self._loaded.move_to_end(user.id)
+
+    def pin(self, user) -> None:
+        with self._lock:
+            self._pins[user.id] = self._pins.get(user.id, 0) + 1
+
+    def unpin(self, user) -> None:
+        with self._lock:
+            pins = self._pins.get(user.id, 0) - 1
+            if pins > 0:
+                self._pins[user.id] = pins
+            else:
+                self._pins.pop(user.id, None)
+
+    def memory_bytes(self) -> int:
+        return sum(user._movies_table.memory_bytes() for user, _ in self._loaded.values()
+                   if user._movies_table is not None)
+
+    def _enforce_budget(self) -> None:
+        used = self.memory_bytes()
+        # The most recently used table stays, even if it alone is over the budget
+        for user_id in list(self._loaded)[:-1]:
+            if used <= self.memory_budget:
+                return
+            if user_id in self._pins:
+                continue
+            table = self._loaded[user_id][0]._movies_table
+            used -= table.memory_bytes() if table is not None else 0
+            self.evict(user_id)
+
+    def evict(self, user_id: int) -> None:
+        """Writes the user's table to its file if it changed, and drops it from memory."""
+        with self._lock:
+            user, saved_version = self._loaded.pop(user_id)
+            table = user._movies_table
+            if table is None:
+                return
+            if table._version != saved_version and (table._stats.count or os.path.exists(self._path(user_id))):
+                table.to_binary(self._path(user_id))
+                self.writes += 1
+            RESULT_CACHE.invalidate(table)
+            user._movies_table = None
+            self.evictions += 1
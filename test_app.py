@@ -1,12 +1,40 @@
+import asyncio
+import gc
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
 import pytest
+import numpy as np
 import pandas as pd
 from typing import List
 
 # Import classes from the application files
-from Handlers import BaseIOHandler
-from users import User, Authentication
-from user_movies_table import User_movie_table
+from Handlers import BaseIOHandler, BatchIOHandler
+from users import User, Authentication, NO_PASSWORD
+from user_movies_table import User_movie_table, BINARY_RANKS_FILE
 from Game import Game
+from genre_profiles import GenreProfileMatrix
+from recommender import ItemBasedRecommender
+from convert_to_binary import convert_json_to_binary
+from bulk_import import import_ratings
+from server import GameServer
+from load_generator import run_load
+from user_registry import UserRegistry
+from instrumentation import Instrumentation
+from storage_engine import StorageEngine
+from table_store import TableStore
+from startup_check import measure_startup
+from lazy_imports import lazy_import
+from lsh_index import GenreLSHIndex, recall_report, generate_users
+from catalog import CATALOG
+from batch_precompute import precompute, PrecomputedResults
+from batch_mode import replay_script, generate_script, SCRIPT_PASSWORD
+from result_cache import ResultCache, RESULT_CACHE
+from benchmarks import run_benchmarks, generate_user_tables, generate_movies, generate_genres
 
 
 # Mock IO Handler for automated testing
@@ -45,6 +73,12 @@ def user_a(valid_password):
     return User(user_name="Alice", user_id=0, password=valid_password)
 
 
+def user_with_table(table: User_movie_table) -> User:
+    user = User(f"user{table.user_id}", table.user_id, password_hash=NO_PASSWORD)
+    user.movies_table = table
+    return user
+
+
 # --- Test Cases ---
 
 def test_password_hashing_and_checking(valid_password):
@@ -55,6 +89,47 @@ def test_password_hashing_and_checking(valid_password):
     assert not Authentication.check_password("WrongPass123!", hashed_password)
 
 
+def test_batch_and_async_hashing(valid_password):
+    """Tests the thread pool backed hashing API and the configurable work factor."""
+    rounds = Authentication.rounds
+    Authentication.configure(rounds=4)
+    try:
+        hashes = Authentication.hash_passwords([valid_password, "Other123!", valid_password])
+        assert len(hashes) == 3 and hashes[0] != hashes[2]
+        assert hashes[0].startswith(b"$2b$04$")
+        assert Authentication.check_password_async(valid_password, hashes[2]).result()
+        assert not Authentication.check_password_async(valid_password, hashes[1]).result()
+        assert Authentication.check_password("Other123!", Authentication.hash_password_async("Other123!").result())
+    finally:
+        Authentication.configure(rounds=rounds)
+
+
+class TestUserRegistry:
+    """Tests the users index of the game."""
+
+    def test_lookup_and_id_allocation(self, valid_password):
+        """Tests lookups by name and id, and that new ids continue after the highest registered id."""
+        existing = User("old", 7, password_hash=b"hash")
+        registry = UserRegistry([existing])
+        assert registry.get("old") is existing and registry.get_by_id(7) is existing
+        assert "old" in registry and "new" not in registry
+
+        new_user = registry.register("new", b"hash")
+        assert new_user.id == 8 and registry.get("new") is new_user
+        assert registry.register("new", b"other") is None
+        with pytest.raises(ValueError):
+            registry.add(User("old", 9, password_hash=b"hash"))
+        assert [user.user_name for user in registry] == ["old", "new"]
+        assert len(registry) == 2
+
+    def test_users_are_compact(self):
+        """Tests that users have no instance dict and build their movie table only when used."""
+        user = User("slim", 0, password_hash=b"hash")
+        assert not hasattr(user, '__dict__')
+        assert user._movies_table is None
+        assert user.movies_table is user.movies_table
+
+
 class TestUserMovieTable:
     """Tests the functionality of the User_movie_table class."""
 
@@ -64,6 +139,7 @@ class TestUserMovieTable:
         table = User_movie_table(user_id=0, handler=handler)
         table.print_basic_stats()
         assert "No movies in the list" in handler.last_output()
+        assert math.isnan(table.get_avg_ranking())
 
     def test_stats_on_valid_table(self):
         """Tests calculation of best, worst, and average ranks."""
@@ -84,6 +160,259 @@ class TestUserMovieTable:
         avg = table.get_avg_ranking()
         assert avg == pytest.approx(5.67)
 
+    def test_add_movies_from_user(self):
+        """Tests that movies entered by the user are visible once the table is read."""
+        handler = MockIOHandler(["Inception", "10", "Sci-Fi", "Titanic", "abc", "Romance", "quit"])
+        table = User_movie_table(user_id=0, handler=handler)
+        table.add_movies_from_user()
+
+        assert list(table.df['name']) == ['Inception', 'Titanic']
+        assert list(table.df['rank']) == [10, 5]
+        assert list(table.df['user_id']) == [0, 0]
+
+    def test_bulk_add_movies(self):
+        """Tests that bulk added rows are merged with the existing rows in order."""
+        table = User_movie_table(user_id=3)
+        table.add_movie('A', 7, 'G1')
+        assert len(table.df) == 1
+        table.add_movies(('M%d' % i, i % 10 + 1, 'G2') for i in range(1000))
+
+        assert len(table.df) == 1001
+        assert table.df.iloc[0]['name'] == 'A'
+        assert table.df.iloc[-1]['name'] == 'M999'
+        assert table.get_best_movie() == ('M9', 10)
+
+    def test_stats_follow_additions_and_removals(self):
+        """Tests that best, worst and average stay correct as movies come and go."""
+        table = User_movie_table(user_id=0)
+        table.add_movies([('A', 9, 'G1'), ('B', 9, 'G1'), ('C', 2, 'G2'), ('D', 5, 'G2')])
+        assert table.get_best_movie() == ('A', 9)
+        assert table.get_worst_movie() == ('C', 2)
+        assert table.get_avg_ranking() == pytest.approx(6.25)
+
+        assert table.remove_movie('A') == 1
+        assert table.get_best_movie() == ('B', 9)
+        table.remove_movie('C')
+        assert table.get_worst_movie() == ('D', 5)
+        assert table.get_avg_ranking() == pytest.approx(7)
+        assert list(table.df['name']) == ['B', 'D']
+
+    def test_best_and_worst_without_scanning(self):
+        """Tests that best and worst movies are found without merging new rows, also after removals."""
+        table = User_movie_table(user_id=0)
+        table.add_movies([('A', 5, 'G'), ('B', 9, 'G'), ('C', 9, 'G')])
+        table.columns()
+        table.add_movies([('D', 1, 'G'), ('E', 1, 'G')])
+        assert table.get_best_movie() == ('B', 9) and table.get_worst_movie() == ('D', 1)
+        assert len(table._pending) == 2
+
+        table.remove_movie('B')
+        table.add_movie('D', 3, 'G')
+        assert table.get_best_movie() == ('C', 9) and table.get_worst_movie() == ('E', 1)
+        table.add_movie('A', 9, 'G')
+        assert table.get_best_movie() == ('A', 9)
+
+    def test_rows_are_stored_as_catalog_ids(self):
+        """Tests that titles and genres are shared catalog ids and whole ranks take a byte."""
+        first = User_movie_table(user_id=0)
+        first.add_movies([('Up', 8, 'Drama'), ('Heat', 7, 'drama')])
+        second = User_movie_table(user_id=1)
+        second.add_movie('Up', 9, 'Drama')
+
+        name_ids, ranks, genre_ids = first.columns()
+        assert name_ids.dtype == 'int32' and ranks.dtype == 'int8'
+        assert name_ids[0] == second.columns()[0][0] == CATALOG.find_title('Up')
+        assert list(CATALOG.genre_keys_of(genre_ids)) == [CATALOG.genre_keys.get('drama')] * 2
+        assert first.get_genre_means() == {'Drama': 8, 'drama': 7}
+
+        first.add_movie('Big', 8.5, 'Drama')
+        second.add_movie('Long', 1000, 'Drama')
+        assert first.columns()[1].dtype == 'float64' and second.columns()[1].dtype == 'int64'
+        assert list(first.df['rank']) == [8, 7, 8.5]
+        assert list(second.df['rank']) == [9, 1000]
+
+    def test_reentered_movie_is_ranked_in_place(self):
+        """Tests that a movie entered again, under any case or spacing, updates its row instead of adding one."""
+        table = User_movie_table(user_id=0)
+        table.add_movies([('The Matrix', 3, 'Sci-Fi'), ('Heat', 7, 'Crime')])
+        table.columns()
+        table.add_movie('the  MATRIX', 9, 'Action')
+        table.add_movie('Up', 6, 'Drama')
+        table.add_movie('up', 200, 'Drama')
+
+        assert list(table.df['name']) == ['The Matrix', 'Heat', 'Up']
+        assert list(table.df['rank']) == [9, 7, 200]
+        assert table.get_best_movie() == ('Up', 200)
+        assert table.get_worst_movie() == ('Heat', 7)
+        assert table.get_genre_means() == {'Crime': 7, 'Action': 9, 'Drama': 200}
+        assert table.has_movie('THE MATRIX') and not table.has_movie('Matrix')
+
+        assert table.remove_movie('heat') == 1
+        table.add_movie('UP', 5, 'Drama')
+        assert list(table.df['rank']) == [9, 5]
+        assert table.get_avg_ranking() == 7
+
+    def test_loaded_duplicates_are_merged(self):
+        """Tests that rows of the same movie in loaded data become one row with the last rank."""
+        table = User_movie_table(user_id=0)
+        table.df = pd.DataFrame({'name': ['Alien', 'Heat', 'ALIEN', 'Up'], 'rank': [4, 7, 8, 5],
+                                 'genre': ['Horror', 'Crime', 'Sci-Fi', 'Drama'], 'user_id': [0] * 4})
+
+        assert list(table.df['name']) == ['Alien', 'Heat', 'Up']
+        assert list(table.df['rank']) == [8, 7, 5]
+        assert table.get_genre_means() == {'Sci-Fi': 8, 'Crime': 7, 'Drama': 5}
+        table.add_movie('alien', 2, 'Sci-Fi')
+        assert len(table.df) == 3 and table.get_worst_movie() == ('Alien', 2)
+
+    def test_concurrent_changes_and_reads(self):
+        """Tests that threads adding, re-ranking and reading the same table keep one consistent row per movie."""
+        table = User_movie_table(user_id=0)
+
+        def add(offset):
+            for i in range(300):
+                table.add_movie('M%d' % ((i + offset) % 200), i % 10 + 1, 'G')
+                if i % 7 == 0:
+                    table.columns()
+
+        threads = [threading.Thread(target=add, args=(offset,)) for offset in range(0, 200, 50)]
+        switch_interval = sys.getswitchinterval()
+        # Switch threads often, so they interleave inside the table's methods
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        name_ids, ranks, _ = table.columns()
+        assert sorted(table.df['name']) == sorted('M%d' % i for i in range(200))
+        assert {CATALOG.title_key(int(name_ids[position])): position for position in table._title_index.values()} \
+            == table._title_index
+        assert table._stats.count == 200 and table._stats.total == ranks.sum()
+
+    def test_search_titles_by_prefix(self):
+        """Tests the case-insensitive title search, which follows additions."""
+        table = User_movie_table(user_id=0)
+        table.add_movies([('Star Wars', 9, 'Sci-Fi'), ('Stardust', 7, 'Fantasy'), ('star trek', 8, 'Sci-Fi'),
+                          ('Alien', 6, 'Horror')])
+
+        assert table.search_titles('STAR') == ['star trek', 'Star Wars', 'Stardust']
+        assert table.search_titles('star ') == ['star trek', 'Star Wars']
+        assert table.search_titles('star', limit=1) == ['star trek']
+        assert table.search_titles('Zed') == []
+        table.add_movie('Starman', 6, 'Sci-Fi')
+        assert table.search_titles('starm') == ['Starman']
+
+    def test_similarity_recommendations_skip_seen_movies(self):
+        """Tests that movies the user rated under another spelling are not recommended."""
+        first = User_movie_table(user_id=0)
+        first.add_movies([('Alien', 9, 'Sci-Fi'), ('heat', 6, 'Sci-Fi')])
+        second = User_movie_table(user_id=1)
+        second.add_movies([('Heat', 10, 'Sci-Fi'), ('Dune', 9, 'Sci-Fi'), ('Solaris', 3, 'Sci-Fi')])
+
+        assert User_movie_table._similarity_recommendations(first, second) == ['Dune']
+
+    def test_stats_after_json_round_trip(self, tmp_path, monkeypatch):
+        """Tests that a table loaded from json reports the stats of the saved movies."""
+        monkeypatch.chdir(tmp_path)
+        table = User_movie_table(user_id=4)
+        table.add_movies([('A', 3, 'G1'), ('B', 8, 'G2')])
+        table.to_json()
+
+        loaded = User_movie_table.create_from_json("user_4_data.json", MockIOHandler())
+        assert loaded.get_best_movie() == ('B', 8)
+        assert loaded.get_worst_movie() == ('A', 3)
+        assert loaded.get_avg_ranking() == pytest.approx(5.5)
+
+    def test_binary_round_trip(self, tmp_path):
+        """Tests that a table saved in the binary format loads back with the same rows and compact ranks."""
+        table = User_movie_table(user_id=4)
+        table.add_movies([('A', 3, 'G1'), ('B', 8, 'G2'), ('C', 5, 'G1')])
+        path = table.to_binary(str(tmp_path / "user_4_data"))
+
+        loaded = User_movie_table.create_from_binary(path, MockIOHandler())
+        assert loaded.user_id == 4
+        assert loaded.df.astype(object).to_dict(orient="records") == table.df.to_dict(orient="records")
+        assert not loaded.df['rank'].to_numpy().flags.writeable
+        assert np.load(os.path.join(path, BINARY_RANKS_FILE)).dtype == np.int8
+        assert loaded.columns()[1].dtype == np.int8
+        assert loaded.get_best_movie() == ('B', 8)
+
+        loaded.add_movie('D', 10, 'G3')
+        assert list(loaded.df['name']) == ['A', 'B', 'C', 'D']
+
+    def test_binary_overwrite_is_atomic(self, tmp_path, monkeypatch):
+        """Tests that overwriting a saved table never leaves a mix of old and new files to load."""
+        path = str(tmp_path / "user_4_data")
+        table = User_movie_table(user_id=4)
+        table.add_movies([('A', 3, 'G1'), ('B', 8, 'G2')])
+        table.to_binary(path)
+        table.add_movie('C', 5, 'G1')
+        table.to_binary(path)
+        assert sorted(os.listdir(tmp_path)) == ["user_4_data"]
+        assert list(User_movie_table.create_from_binary(path).df['name']) == ['A', 'B', 'C']
+
+        # Interrupted after the previous table was moved aside, before the new one was moved in
+        replace = os.replace
+
+        def fail_moving_in(source, destination):
+            if source.endswith(".tmp"):
+                raise OSError("interrupted")
+            replace(source, destination)
+
+        monkeypatch.setattr(os, "replace", fail_moving_in)
+        table.add_movie('D', 7, 'G1')
+        with pytest.raises(OSError):
+            table.to_binary(path)
+        assert list(User_movie_table.create_from_binary(path).df['name']) == ['A', 'B', 'C']
+
+    def test_convert_json_to_binary(self, tmp_path, monkeypatch):
+        """Tests that existing json files convert to the binary format."""
+        monkeypatch.chdir(tmp_path)
+        table = User_movie_table(user_id=2)
+        table.add_movies([('A', 7.5, 'G1')])
+        table.to_json()
+
+        path = convert_json_to_binary("user_2_data.json")
+        assert path == "user_2_data"
+        loaded = User_movie_table.create_from_binary(path, MockIOHandler())
+        assert loaded.get_best_movie() == ('A', 7.5)
+
+        handler = MockIOHandler()
+        assert User_movie_table.create_from_binary("missing", handler) is None
+        assert handler.last_output() == "Binary file not found."
+
+    def test_movie_recommendation_by_genre(self):
+        """Tests that recommendations come best first per genre and stop when a genre runs out."""
+        handler = MockIOHandler(["drama", "", "DRAMA", "", "drama", "", "comedy", "exit"])
+        table = User_movie_table(user_id=0, handler=handler)
+        table.add_movies([('A', 6, 'Drama'), ('B', 9, 'drama'), ('C', 7, 'Comedy')])
+        table.get_movie_recommendation()
+
+        output = handler.all_output()
+        assert "Available genres: Drama, drama, Comedy" in handler.outputs[0]
+        assert "Our best movie from drama genre is B with the rank of 9" in output
+        assert "Our best movie from DRAMA genre is A with the rank of 6" in output
+        assert "We don't have any movies answering to this genre name." in output
+        assert handler.outputs[-2] == "Available genres: Comedy"
+        assert "Our best movie from comedy genre is C with the rank of 7" in output
+
+    def test_long_recommendation_session(self):
+        """Tests that a long session walks the whole genre without hitting the recursion limit."""
+        count = 3000
+        handler = MockIOHandler(["g", ""] * count + ["g"])
+        table = User_movie_table(user_id=0, handler=handler)
+        table.add_movies(('M%d' % i, i, 'G') for i in range(count))
+        table.get_movie_recommendation()
+
+        assert f"is M{count - 1} with the rank of {count - 1}" in handler.outputs[1]
+        assert handler.last_output() == "No more movies available for recommendations."
+        # The index is reused by the next session and still holds every movie
+        assert table._get_genre_index() is table._get_genre_index()
+        assert len(table._get_genre_index().movies['g']) == count
+
     def test_are_similar_true(self):
         """Tests if two tables with similar genre averages are correctly identified."""
         table1 = User_movie_table(0)
@@ -98,6 +427,17 @@ class TestUserMovieTable:
         ])
         assert User_movie_table.are_similar(table1, table2)
 
+    def test_genre_means_follow_changes(self):
+        """Tests that the cached genre profile matches a full recomputation after every change."""
+        table = User_movie_table(0)
+        table.add_movies([('A', 8, 'G1'), ('B', 5, 'G2'), ('C', 6, 'G1')])
+        assert table.get_genre_means() == table.df.groupby('genre')['rank'].mean().to_dict()
+
+        table.remove_movie('B')
+        assert table.get_genre_means() == {'G1': 7}
+        table.df = pd.DataFrame([{'name': 'D', 'rank': 3, 'genre': 'G3', 'user_id': 0}])
+        assert table.get_genre_means() == {'G3': 3}
+
     def test_are_similar_false_diff_ranks(self):
         """Tests that tables with >0.5 rank difference are not similar."""
         table1 = User_movie_table(0)
@@ -107,6 +447,703 @@ class TestUserMovieTable:
         assert not User_movie_table.are_similar(table1, table2)
 
 
+class TestResultCache:
+    def test_repeated_comparison_is_served_from_cache(self):
+        table1 = User_movie_table(0)
+        table1.add_movies([('A', 8, 'G1'), ('B', 6, 'G2')])
+        table2 = User_movie_table(1)
+        table2.add_movies([('C', 9, 'G1'), ('D', 6, 'G2'), ('E', 7, 'G1'), ('F', 10, 'G2'), ('H', 2, 'G2')])
+        handler = MockIOHandler()
+
+        User_movie_table.movies_recommendations_based_on_similarity(table1, table2, handler)
+        misses = RESULT_CACHE.misses
+        hits = RESULT_CACHE.hits
+        User_movie_table.movies_recommendations_based_on_similarity(table1, table2, handler)
+        assert RESULT_CACHE.misses == misses
+        assert RESULT_CACHE.hits == hits + 2
+        assert handler.outputs[1:3] == handler.outputs[4:6] == ['F', 'C']
+
+    def test_change_invalidates_entries(self):
+        table1 = User_movie_table(0)
+        table1.add_movies([('A', 8, 'G1'), ('E', 9, 'G1')])
+        table2 = User_movie_table(1)
+        table2.add_movies([('C', 9, 'G1'), ('E', 8, 'G1')])
+        handler = MockIOHandler()
+        User_movie_table.movies_recommendations_based_on_similarity(table1, table2, handler)
+        assert handler.outputs == ["Here are some recommendations for movies you may like: ", 'C']
+
+        table1.add_movie('C', 8, 'G1')
+        assert table1._cached is False
+        User_movie_table.movies_recommendations_based_on_similarity(table1, table2, handler)
+        assert handler.last_output() == "There are no recommendations."
+
+        table2.df = pd.DataFrame([{'name': 'A', 'rank': 1, 'genre': 'G1', 'user_id': 1}])
+        assert not User_movie_table.are_similar(table1, table2)
+
+    def test_bounded_lru(self):
+        cache = ResultCache(max_entries=2)
+        tables = [User_movie_table(user_id) for user_id in range(3)]
+        for table in tables:
+            cache.get_or_compute("kind", (table,), lambda: table.user_id)
+        assert len(cache) == 2
+        assert cache.get_or_compute("kind", (tables[0],), lambda: "recomputed") == "recomputed"
+        assert cache.stats() == {"hits": 0, "misses": 4, "entries": 2, "max_entries": 2}
+        cache.invalidate(tables[0])
+        assert len(cache) == 1
+
+
+class TestGenreProfileMatrix:
+    """Tests the batched similar users search."""
+
+    def test_matches_pairwise_are_similar(self):
+        """Tests that the matrix finds exactly the users that are_similar accepts."""
+        rng = random.Random(7)
+        users = []
+        for user_id in range(60):
+            table = User_movie_table(user_id)
+            genres = rng.sample(['G1', 'G2', 'G3'], rng.randint(0, 2))
+            table.add_movies(('M%d' % i, rng.randint(6, 8), rng.choice(genres)) for i in range(rng.randint(1, 4))
+                             if genres)
+            users.append(user_with_table(table))
+
+        matrix = GenreProfileMatrix()
+        matrix.refresh(users)
+        for user in users:
+            expected = [other for other in users if other is not user and
+                        User_movie_table.are_similar(user.movies_table, other.movies_table)]
+            assert matrix.similar_users(user) == expected
+
+    def test_refresh_follows_table_changes(self):
+        """Tests that rows are recomputed when a table gets new movies or is replaced."""
+        first = user_with_table(User_movie_table(0))
+        second = user_with_table(User_movie_table(1))
+        first.movies_table.add_movie('A', 8, 'G1')
+        second.movies_table.add_movie('B', 8, 'G2')
+        matrix = GenreProfileMatrix()
+        matrix.refresh([first, second])
+        assert matrix.similar_users(first) == []
+
+        second.movies_table.add_movie('C', 8, 'G1')
+        first.movies_table.add_movie('D', 8, 'G2')
+        matrix.refresh([first, second])
+        assert matrix.similar_users(first) == [second]
+
+        second.movies_table = User_movie_table(1)
+        matrix.refresh([first, second])
+        assert matrix.similar_users(first) == []
+
+    def test_refresh_creates_no_tables(self):
+        """Tests that users who never had a table are skipped without getting an empty one."""
+        users = UserRegistry([User("rated", 0, password_hash=NO_PASSWORD), User("idle", 1, password_hash=NO_PASSWORD)])
+        users.get("rated").movies_table.add_movie('A', 8, 'G1')
+        matrix = GenreProfileMatrix()
+        matrix.refresh(users)
+
+        assert len(matrix) == 1
+        assert users.get("idle")._movies_table is None
+
+    def test_refresh_of_a_registry_reads_only_changed_users(self, monkeypatch):
+        """Tests that a registry refreshed again only refreshes the users changed or registered since."""
+        listeners = len(User_movie_table.change_listeners)
+        users = UserRegistry()
+        for user_id in range(50):
+            users.register(f"user{user_id}", NO_PASSWORD).movies_table.add_movie(f"M{user_id}", 5, 'G1')
+        matrix = GenreProfileMatrix()
+        matrix.refresh(users)
+        refreshed = []
+        refresh_user = matrix._refresh_user
+        monkeypatch.setattr(matrix, "_refresh_user", lambda user: refreshed.append(user.id) or refresh_user(user))
+
+        matrix.refresh(users)
+        assert refreshed == []
+
+        first = users.get_by_id(0)
+        first.movies_table.add_movie('A', 10, 'G2')
+        newcomer = users.register("newcomer", NO_PASSWORD)
+        newcomer.movies_table.add_movies([('B', 10, 'G2'), ('C', 5, 'G1')])
+        matrix.refresh(users)
+        assert set(refreshed) == {0, 50}
+        assert matrix.similar_users(first) == [newcomer]
+
+        # A table replaced by an empty one never changes, the replacement itself is reported
+        newcomer.movies_table = User_movie_table(newcomer.id)
+        matrix.refresh(users)
+        assert matrix.similar_users(first) == []
+
+        del matrix, refresh_user
+        monkeypatch.undo()
+        gc.collect()
+        assert len(User_movie_table.change_listeners) == listeners
+
+    def test_grows_only_the_exceeded_dimension(self):
+        """Tests that many users don't multiply the genre columns, nor many genres the user rows."""
+        users = []
+        for user_id in range(3000):
+            table = User_movie_table(user_id)
+            table.add_movie('M%d' % user_id, 7, 'G%d' % (user_id % 5))
+            users.append(user_with_table(table))
+        matrix = GenreProfileMatrix()
+        matrix.refresh(users)
+
+        assert matrix.values.shape == (3000, 5)
+        assert matrix._values.shape[0] < 2 * 3000 and matrix._values.shape[1] == 8
+
+
+class TestGenreLSHIndex:
+    """Tests the approximate similar users search."""
+
+    def test_recall_against_exact_search(self):
+        users = generate_users(300, 4, seed=3)
+        index = GenreLSHIndex()
+        index.attach(users)
+        try:
+            report = recall_report(users, index)
+            matrix = GenreProfileMatrix()
+            matrix.refresh(users)
+            for user in list(users)[:20]:
+                # Candidates are checked exactly, so every user found is a real match
+                assert set(index.similar_users(user)) <= set(matrix.similar_users(user))
+        finally:
+            index.detach()
+        assert report["queries"] == 300
+        assert report["exact_pairs"] > 0
+        assert report["recall"] >= 0.95
+        assert report["mean_candidates"] < 300
+
+    def test_follows_ratings_and_new_users(self):
+        users = UserRegistry()
+        first = User("first", 0, password_hash=b"")
+        first.movies_table.add_movie('A', 8, 'G1')
+        users.add(first)
+        index = GenreLSHIndex()
+        index.attach(users)
+        try:
+            second = users.register("second", b"")
+            assert index.similar_users(first) == []
+            second.movies_table.add_movie('B', 7, 'G1')
+            assert index.similar_users(first) == []
+            second.movies_table.add_movie('C', 10, 'G1')
+            assert index.similar_users(first) == [second]
+            second.movies_table = User_movie_table(1)
+            assert index.similar_users(first) == []
+            assert index.similar_users(second) == []
+        finally:
+            index.detach()
+        assert index._mark_dirty not in User_movie_table.change_listeners
+
+    def test_loads_evicted_tables(self, tmp_path):
+        store = TableStore(str(tmp_path), memory_budget=3000)
+        users = UserRegistry()
+        users.attach_table_store(store)
+        first, second = users.register("first", b""), users.register("second", b"")
+        index = GenreLSHIndex()
+        index.attach(users)
+        try:
+            first.movies_table.add_movies([(f"A{i}", 8, 'G1') for i in range(20)])
+            second.movies_table.add_movies([(f"B{i}", 8, 'G1') for i in range(20)])
+            assert first._movies_table is None
+            # Loading the evicted table reports a change while the index is locked
+            worker = threading.Thread(target=lambda: results.append(index.similar_users(second)), daemon=True)
+            results = []
+            worker.start()
+            worker.join(timeout=5)
+            assert results == [[first]]
+        finally:
+            index.detach()
+
+
+class TestItemBasedRecommender:
+    """Tests the collaborative filtering recommendations."""
+
+    @staticmethod
+    def _make_user(user_id, ratings):
+        table = User_movie_table(user_id)
+        table.add_movies((name, rank, 'Drama') for name, rank in ratings)
+        return user_with_table(table)
+
+    def test_recommends_unseen_movies_by_co_ratings(self):
+        """Tests that movies rated together with the user's movies come first and seen ones are skipped."""
+        users = [
+            self._make_user(0, [('A', 9), ('B', 8)]),
+            self._make_user(1, [('A', 9), ('B', 8), ('C', 9)]),
+            self._make_user(2, [('A', 8), ('C', 10), ('D', 2)]),
+            self._make_user(3, [('E', 7)]),
+        ]
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+
+        recommendations = recommender.recommend(users[0])
+        # E was never rated together with A or B, and A and B were already seen
+        assert sorted(name for name, _ in recommendations) == ['C', 'D']
+        predicted_ranks = [rank for _, rank in recommendations]
+        assert predicted_ranks == sorted(predicted_ranks, reverse=True)
+        assert all(8 <= rank <= 9 for rank in predicted_ranks)
+        assert recommender.recommend(users[3]) == []
+
+    def test_refresh_rebuilds_only_after_changes(self):
+        """Tests that the model is rebuilt when a table changes and reused otherwise."""
+        users = [self._make_user(0, [('A', 9)]), self._make_user(1, [('A', 9), ('B', 9)])]
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+        indptr = recommender.indptr
+        recommender.refresh(users)
+        assert recommender.indptr is indptr
+
+        users[0].movies_table.add_movie('B', 5, 'Drama')
+        recommender.refresh(users)
+        assert recommender.recommend(users[0]) == []
+
+    def test_refresh_creates_no_tables(self):
+        """Tests that users who never had a table are skipped without getting an empty one."""
+        users = UserRegistry([user_with_table(User_movie_table(0)), User("idle", 1, password_hash=NO_PASSWORD)])
+        users.get_by_id(0).movies_table.add_movie('A', 8, 'Drama')
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+
+        assert recommender.recommend(users.get("idle")) == []
+        assert users.get("idle")._movies_table is None
+
+    def test_spellings_of_a_title_are_one_movie(self):
+        """Tests that a movie rated under another spelling of its title is not recommended."""
+        users = [self._make_user(0, [('inception', 9), ('Heat', 8)]),
+                 self._make_user(1, [('Inception', 9), ('Heat ', 8), ('Up', 9)])]
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+
+        assert recommender.movie_names == ['inception', 'Heat', 'Up']
+        assert recommender.recommend(users[0]) == [('Up', 8.5)]
+
+    def test_matches_dense_item_similarities(self):
+        """Tests the sparse scoring against cosine similarities computed over the dense ratings matrix."""
+        rng = random.Random(3)
+        users = [self._make_user(user_id, [('M%d' % i, rng.randint(1, 10)) for i in rng.sample(range(40), 8)])
+                 for user_id in range(30)]
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+
+        column = {name: i for i, name in enumerate(recommender.movie_names)}
+        ratings = np.zeros((len(users), len(column)))
+        for row, user in enumerate(users):
+            for name, rank, _ in user.movies_table.iter_rows():
+                ratings[row, column[name]] = rank
+        norms = np.linalg.norm(ratings, axis=0)
+        similarities = ratings.T @ ratings / np.outer(norms, norms)
+        np.fill_diagonal(similarities, 0)
+        for row, user in enumerate(users[:5]):
+            seen = np.flatnonzero(ratings[row])
+            scores = similarities[:, seen] @ ratings[row, seen] / similarities[:, seen].sum(axis=1)
+            for name, predicted_rank in recommender.recommend(user, amount=10):
+                assert predicted_rank == round(scores[column[name]], 2)
+
+
+class TestBatchPrecompute:
+    """Tests the offline similar users and recommendations job."""
+
+    @pytest.fixture
+    def users(self):
+        rng = random.Random(11)
+        users = UserRegistry()
+        for user_id in range(40):
+            user = User(f"user{user_id}", user_id, password_hash=b"")
+            genres = rng.sample(['G1', 'G2'], rng.randint(1, 2))
+            user.movies_table.add_movies((f"M{rng.randrange(30)}", rng.randint(6, 10), rng.choice(genres))
+                                         for _ in range(rng.randint(1, 8)))
+            users.add(user)
+        return users
+
+    def test_matches_the_interactive_rules(self, users):
+        results = precompute(users, workers=1)
+        assert len(results) == len(users)
+        for user in users:
+            similar, recommendations = results.get(user.id)
+            expected = [other for other in users if other is not user and
+                        User_movie_table.are_similar(user.movies_table, other.movies_table)]
+            assert similar == [other.user_name for other in expected]
+            if len(expected) == 1:
+                handler = MockIOHandler()
+                User_movie_table.movies_recommendations_based_on_similarity(
+                    user.movies_table, expected[0].movies_table, handler)
+                # A title the other user entered twice is recommended once
+                assert recommendations == list(dict.fromkeys(handler.outputs[1:]))
+
+    def test_process_pool_and_store(self, users, tmp_path):
+        results = precompute(users, workers=2)
+        assert results.results == precompute(users, workers=1).results
+        path = str(tmp_path / "results.json")
+        results.save(path)
+        assert PrecomputedResults.load(path).results == results.results
+        assert PrecomputedResults.load(str(tmp_path / "missing.json")) is None
+
+    def test_game_serves_the_results(self, valid_password):
+        handler = MockIOHandler(["1", "first", valid_password, "14", "8", "3"])
+        game = Game(handler, precomputed=PrecomputedResults({0: (["second"], ["Up", "Heat"])}))
+        game.users.append(User("first", 0, password=valid_password))
+        game.show_main_menu()
+        output = handler.all_output()
+        assert "Users with a taste similar to first: second" in output
+        assert "Up\nHeat" in output
+
+
+class TestBatchMode:
+    """Tests driving the game from a JSONL script."""
+
+    def test_handler_reads_inputs_and_checks_expectations(self):
+        output = io.StringIO()
+        seeded = []
+        lines = ['"1"', '', '{"input": 2, "expect": "found"}', '{"users": [{"user_name": "a"}]}',
+                 '{"request_id": "x"}', 'null', 'true', '[1]', '{"input": "3", "expect": "missing"}', '4']
+        handler = BatchIOHandler(lines, output, buffer_lines=2, on_users=seeded.extend)
+
+        assert handler.get_user_input() == "1"
+        handler.display_output("ignored")
+        assert handler.get_user_input() == "2"
+        handler.display_output("it was found")
+        assert output.getvalue() == "ignored\nit was found\n"
+        assert handler.get_user_input() == "3"
+        handler.display_output("something else")
+        assert handler.get_user_input() == "4"
+        with pytest.raises(EOFError):
+            handler.get_user_input()
+        handler.close()
+
+        assert seeded == [{"user_name": "a"}]
+        assert (handler.inputs, handler.outputs, handler.skipped) == (4, 3, 4)
+        assert handler.mismatches == [(9, "missing")]
+        assert output.getvalue().endswith("something else\n")
+
+    def test_replay_generated_script(self, tmp_path, monkeypatch, valid_password):
+        monkeypatch.setattr(Authentication, "rounds", 4)
+        path = tmp_path / "script.jsonl"
+        lines = generate_script(sessions=8, movies_per_session=2)
+        # A signup of a new user in the middle of the trace
+        lines[-1:-1] = [json.dumps(value) for value in ["2", "newcomer", valid_password, "8"]]
+        path.write_text("\n".join(lines) + "\n")
+
+        users = UserRegistry()
+        summary = replay_script(str(path), users)
+        assert summary.mismatches == []
+        assert summary.inputs == len(lines) - 1
+        assert len(users) == 3
+        assert Authentication.check_password(SCRIPT_PASSWORD, users.get("user0").password)
+        assert sum(user.movies_table._stats.count for user in users) == 16
+
+
+class TestBulkImport:
+    """Tests streaming ratings dumps into the users of a game."""
+
+    def test_import_csv_in_chunks(self, tmp_path, valid_password):
+        """Tests that rows reach the right users across chunks and unknown users are created."""
+        path = tmp_path / "ratings.csv"
+        lines = ["user_name,name,rank,genre"] + [f"user{i % 3},Movie {i},{i % 10 + 1},Drama" for i in range(10)]
+        path.write_text("\n".join(lines))
+        handler = MockIOHandler()
+        game = Game(handler)
+        game.users.append(User("user0", 0, password=valid_password))
+
+        summary = import_ratings(game, str(path), chunk_size=4)
+        assert summary.rows == 10 and summary.users_created == 2
+        assert [user.user_name for user in game.users] == ["user0", "user1", "user2"]
+        assert [user.id for user in game.users] == [0, 1, 2]
+        assert list(game.users.get_by_id(0).movies_table.df['name']) == ['Movie 0', 'Movie 3', 'Movie 6', 'Movie 9']
+        assert len(game.users.get_by_id(2).movies_table.df) == 3
+        assert "Imported 10 rows, 2 new users" in handler.last_output()
+        assert not Authentication.check_password(valid_password, game.users.get_by_id(1).password)
+
+    def test_import_jsonl(self, tmp_path):
+        """Tests importing a JSONL dump."""
+        path = tmp_path / "ratings.jsonl"
+        path.write_text('{"user_name": "a", "name": "X", "rank": 7, "genre": "Comedy"}\n'
+                        '{"user_name": "b", "name": "Y", "rank": 2, "genre": "Drama"}\n')
+        game = Game(MockIOHandler())
+
+        import_ratings(game, str(path))
+        assert game.users.get_by_id(0).movies_table.get_best_movie() == ('X', 7)
+        assert game.users.get_by_id(1).movies_table.get_genre_means() == {'Drama': 2}
+
+
+class TestGameServer:
+    """Tests serving concurrent Game sessions over TCP."""
+
+    def test_concurrent_sessions_share_users(self):
+        """Tests that concurrent sessions complete and all sign up into the shared users list."""
+        rounds = Authentication.rounds
+        Authentication.configure(rounds=4)
+        game_server = GameServer(max_sessions=8)
+
+        async def scenario():
+            server = await game_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await run_load("127.0.0.1", port, sessions=6, concurrency=3, movies=2)
+
+        try:
+            report = asyncio.run(scenario())
+        finally:
+            game_server.shutdown()
+            Authentication.configure(rounds=rounds)
+        assert report["sessions"] == 6
+        assert sorted(user.id for user in game_server.users) == list(range(6))
+        assert all(len(user.movies_table.df) == 2 for user in game_server.users)
+        assert game_server.sessions == 0
+        # The similar users searches of the sessions used the server's matrix
+        assert len(game_server.genre_profiles) > 0
+
+    def test_sessions_of_one_user_keep_their_output(self, valid_password):
+        """Tests that two sessions of the same user each get the output of their own commands."""
+        users = UserRegistry([User("first", 0, password=valid_password)])
+        users.get("first").movies_table.add_movie('A', 8, 'Drama')
+        first, second = MockIOHandler(["B", "6", "Drama", "quit"]), MockIOHandler()
+        first_game, second_game = Game(first, users=users), Game(second, users=users)
+        for game in (first_game, second_game):
+            game.signed_up_user = users.get("first")
+            game.set_commands()
+
+        first_game.commands[1]()
+        first_game.commands[2]()
+        assert "The worst movie is B with the rank of 6" in first.all_output()
+        assert second.outputs == []
+
+
+class TestBenchmarks:
+    """Tests the benchmark suite on a tiny scale."""
+
+    def test_generators_are_seeded(self):
+        """Tests that the same seed generates the same users."""
+        def tables():
+            rng = random.Random(3)
+            return generate_user_tables(3, 20, generate_movies(10, generate_genres(4), rng), rng)
+
+        assert [table.df.to_dict() for table in tables()] == [table.df.to_dict() for table in tables()]
+        # Every rating is of another movie, none of them is re-ranked in place
+        assert [len(table.df) for table in tables()] == [10, 10, 10]
+
+    def test_report_covers_hot_paths(self):
+        """Tests that a run reports every benchmark with its timings."""
+        report = run_benchmarks([50], repeat=1, bcrypt_rounds=4)
+        names = {result["name"] for result in report["results"]}
+        assert names == {"add_movies_from_user", "print_basic_stats", "_get_movie_recommendation", "are_similar",
+                         "movies_recommendations_based_on_similarity", "to_json", "create_from_json",
+                         "bcrypt_login"}
+        assert all(result["best_seconds"] >= 0 for result in report["results"])
+
+    def test_repeats_are_not_served_from_cache(self):
+        """Tests that every repeat of a cached query computes its result again."""
+        hits = RESULT_CACHE.hits
+        run_benchmarks([50], repeat=3, bcrypt_rounds=4)
+        assert RESULT_CACHE.hits == hits
+
+
+@pytest.fixture
+def instrumentation():
+    Instrumentation.reset()
+    Instrumentation.enable()
+    yield Instrumentation
+    Instrumentation.disable()
+    Instrumentation.reset()
+
+
+class TestInstrumentation:
+    """Tests the opt-in latency stats."""
+
+    def test_records_table_operations(self, instrumentation):
+        """Tests that instrumented table operations record calls and rows."""
+        table = User_movie_table(0, MockIOHandler())
+        table.add_movies([('A', 5, 'G'), ('B', 6, 'G')])
+        table.print_basic_stats()
+        table.print_basic_stats()
+        User_movie_table.are_similar(table, table)
+
+        stats = instrumentation.get_stats('User_movie_table.print_basic_stats')
+        assert stats.calls == 2 and stats.rows == 4 and sum(stats.histogram) == 2
+        assert instrumentation.get_stats('User_movie_table.are_similar').rows == 4
+        assert any(line.startswith('User_movie_table.print_basic_stats: calls=2')
+                   for line in instrumentation.report())
+
+    def test_nothing_recorded_when_disabled(self):
+        """Tests that instrumentation is off by default."""
+        Instrumentation.reset()
+        User_movie_table(0, MockIOHandler()).print_basic_stats()
+        assert Instrumentation.report() == []
+
+    def test_game_commands_and_report(self, instrumentation, valid_password):
+        """Tests that game commands are recorded and the stats command prints them."""
+        handler = MockIOHandler(["1", "testuser", valid_password, "2", "13", "8", "3"])
+        game = Game(handler)
+        game.users.append(User("testuser", 0, password=valid_password))
+        game.show_main_menu()
+
+        assert instrumentation.get_stats('Game command 2').calls == 1
+        assert instrumentation.get_stats('Game._handle_log_in').calls == 1
+        assert instrumentation.get_stats('Authentication.check_password').calls == 1
+        assert any(line.startswith("Game command 2: calls=1") for line in handler.outputs)
+
+
+class TestStartup:
+    """Tests that the game starts without importing its heavy dependencies."""
+
+    def test_main_imports_no_heavy_modules(self):
+        """Tests that importing main leaves pandas, numpy, bcrypt, colorama and asyncio unloaded."""
+        report = measure_startup("main")
+        assert report.heavy_modules_loaded == []
+        assert report.total_ms > 0
+
+    def test_lazy_module_loads_on_first_use(self):
+        """Tests that a lazy module forwards attributes to the real module."""
+        lazy_json = lazy_import("json")
+        assert "not loaded" in repr(lazy_json)
+        assert lazy_json.loads("[1]") == [1]
+        assert "not loaded" not in repr(lazy_json)
+
+
+class TestTableStore:
+    """Tests the memory-bounded loading of the movie tables."""
+
+    def test_evicts_least_recently_used_tables(self, tmp_path):
+        # Room for about three small tables
+        store = TableStore(str(tmp_path), memory_budget=3 * 2400)
+        users = UserRegistry()
+        users.attach_table_store(store)
+        for user_id in range(5):
+            user = users.register(f"user{user_id}", b"")
+            user.movies_table.add_movies([(f"M{user_id}", user_id + 1, 'G'), ('Shared', 5, 'G')])
+        assert len(store) == 3
+        assert users.get_by_id(0)._movies_table is None
+        assert store.writes == store.evictions == 2
+
+        # Loaded back from its file, which makes another table the least recently used
+        first = users.get_by_id(0)
+        assert list(first.movies_table.df['name']) == ['M0', 'Shared']
+        assert first.movies_table.get_best_movie() == ('Shared', 5)
+        assert store.loads == 1
+        assert users.get_by_id(2)._movies_table is None
+
+        # Unchanged tables are dropped without being written again
+        users.get_by_id(1).movies_table
+        users.get_by_id(2).movies_table
+        writes = store.writes
+        users.get_by_id(3).movies_table
+        users.get_by_id(4).movies_table
+        assert store.writes == writes
+        assert store.evictions == 7
+
+    def test_pinned_tables_stay(self, tmp_path, valid_password):
+        store = TableStore(str(tmp_path), memory_budget=1)
+        users = UserRegistry()
+        users.attach_table_store(store)
+        handler = MockIOHandler(["1", "first", valid_password, "1", "A", "8", "G", "quit", "4", "second",
+                                 "2", "8", "3"])
+        game = Game(handler, users=users)
+        users.add(User("first", 0, password=valid_password))
+        users.add(User("second", 1, password=valid_password))
+        users.get("second").movies_table.add_movie('B', 8, 'G')
+        game.show_main_menu()
+
+        assert "The taste of first and the taste of second are similar!" in handler.all_output()
+        assert "The best movie is A with the rank of 8" in handler.all_output()
+        assert store._pins == {}
+
+    def test_storage_keeps_evicted_tables(self, tmp_path):
+        store = TableStore(str(tmp_path / "tables"), memory_budget=1)
+        storage = StorageEngine(str(tmp_path), fsync=False)
+        users = storage.load(store)
+        for user_id in range(3):
+            users.register(f"user{user_id}", b"").movies_table.add_movie(f"M{user_id}", 7, 'G')
+        storage.close(snapshot=True)
+
+        users = StorageEngine(str(tmp_path)).load(TableStore(str(tmp_path / "tables"), memory_budget=1))
+        assert [list(user.movies_table.df['name']) for user in users] == [['M0'], ['M1'], ['M2']]
+
+    def test_users_without_files_are_not_loaded(self, tmp_path):
+        store = TableStore(str(tmp_path))
+        users = UserRegistry()
+        users.attach_table_store(store)
+        for user_id in range(1000):
+            users.register(f"user{user_id}", b"")
+        users.get_by_id(0).movies_table.add_movie('A', 8, 'G')
+        users.get_by_id(1).movies_table.add_movie('B', 8, 'G')
+        store.evict(0)
+        store.evict(1)
+
+        matrix = GenreProfileMatrix()
+        matrix.refresh(users)
+        recommender = ItemBasedRecommender()
+        recommender.refresh(users)
+        index = GenreLSHIndex()
+        index.attach(users)
+        index.detach()
+        assert len(store) == 2 and store.loads == 2
+        assert matrix.similar_users(users.get_by_id(0)) == [users.get_by_id(1)]
+        assert recommender.movie_names == ['A', 'B']
+
+
+class TestStorageEngine:
+    """Tests the log and snapshot persistence of the users."""
+
+    def test_session_survives_restart(self, tmp_path, valid_password):
+        """Tests that signups, ratings and password changes are replayed from the log."""
+        new_password = "NewValid456$"
+        storage = StorageEngine(str(tmp_path))
+        inputs = ["2", "alice", valid_password, "1", "Inception", "9", "Sci-Fi", "Up", "7", "Animation", "quit",
+                  "7", valid_password, new_password, "8", "3"]
+        game = Game(MockIOHandler(inputs), users=storage.load(), storage=storage)
+        game.show_main_menu()
+        storage.close()
+
+        users = StorageEngine(str(tmp_path)).load()
+        alice = users.get("alice")
+        assert alice.id == 0
+        assert list(alice.movies_table.df['name']) == ['Inception', 'Up']
+        assert alice.movies_table.get_best_movie() == ('Inception', 9)
+        assert Authentication.check_password(new_password, alice.password)
+
+    def test_snapshot_compacts_the_log(self, tmp_path):
+        """Tests that snapshots empty the log, and that a torn last log line is ignored."""
+        storage = StorageEngine(str(tmp_path), snapshot_every=3, fsync=False)
+        users = storage.load()
+        first = users.register("first", b"hash")
+        first.movies_table.add_movies([('A', 5, 'G'), ('B', 6, 'G')])
+        storage.commit()
+        assert (tmp_path / "changes.log").read_text() == ""
+
+        second = users.register("second", b"hash")
+        second.movies_table.add_movie('C', 4, 'G')
+        first.movies_table.remove_movie('A')
+        storage.close()
+        with open(tmp_path / "changes.log", "a") as file:
+            file.write('{"operation": "rating", "user_id"')
+
+        storage = StorageEngine(str(tmp_path))
+        users = storage.load()
+        assert [user.user_name for user in users] == ["first", "second"]
+        assert list(users.get("first").movies_table.df['name']) == ['B']
+        assert users.get("second").movies_table.get_genre_means() == {'G': 4}
+        assert users.register("third", b"hash").id == 2
+        storage.close()
+        assert [user.user_name for user in StorageEngine(str(tmp_path)).load()] == ["first", "second", "third"]
+
+    def test_read_only_load_leaves_the_files(self, tmp_path):
+        """Tests that a read-only load skips a record still being written and changes no file."""
+        storage = StorageEngine(str(tmp_path), fsync=False)
+        users = storage.load()
+        users.register("first", b"hash").movies_table.add_movie('A', 5, 'G')
+        storage.commit()
+        # A record the game is halfway through writing, complete JSON but no newline yet
+        storage._log.write('{"operation": "rating", "user_id": 0, "name": "B", "rank": 7, "genre": "G", '
+                           '"sequence": 3}')
+        storage._log.flush()
+        log = (tmp_path / "changes.log").read_bytes()
+
+        reader = StorageEngine(str(tmp_path))
+        read_users = reader.load(read_only=True)
+        assert list(read_users.get("first").movies_table.df['name']) == ['A']
+        read_users.get("first").movies_table.add_movie('C', 6, 'G')
+        reader.close()
+        assert (tmp_path / "changes.log").read_bytes() == log
+        storage._log.write("\n")
+        storage.close()
+        assert list(StorageEngine(str(tmp_path)).load().get("first").movies_table.df['name']) == ['A', 'B']
+
+
 class TestGame:
     """Tests the main game logic and user interaction flow."""
 
@@ -139,6 +1176,25 @@ class TestGame:
         assert "Welcome back, testuser!" in output
         assert "Logging out testuser..." in output
 
+    def test_passwords_are_hashed_in_the_pool(self, valid_password, monkeypatch):
+        """Tests that signup and login run bcrypt on the hashing threads, not on the session's thread."""
+        threads = []
+        hash_password, check_password = Authentication.hash_password, Authentication.check_password
+
+        def record(function):
+            def run(*args):
+                threads.append(threading.current_thread().name)
+                return function(*args)
+            return run
+
+        monkeypatch.setattr(Authentication, "hash_password", record(hash_password))
+        monkeypatch.setattr(Authentication, "check_password", record(check_password))
+        handler = MockIOHandler(["2", "first", valid_password, "8", "1", "first", valid_password, "8", "3"])
+        Game(handler).show_main_menu()
+
+        assert "Welcome back, first!" in handler.all_output()
+        assert len(threads) == 2 and all(name.startswith("bcrypt") for name in threads)
+
     def test_login_fail(self, valid_password):
         """Tests login failures for non-existent users and wrong passwords."""
         handler = MockIOHandler(["1", "no_user", "1", "testuser", "WrongPass!", "3"])
@@ -148,4 +1204,60 @@ class TestGame:
         game.show_main_menu()
         output = handler.all_output()
         assert "User name not found" in output
-        assert "Invalid password" in output
\ No newline at end of file
+        assert "Invalid password" in output
+
+    def test_find_similar_users(self, valid_password):
+        """Tests the menu command listing every user with a similar taste."""
+        handler = MockIOHandler(["1", "first", valid_password, "9", "8", "3"])
+        game = Game(handler)
+        for user_id, (name, rank) in enumerate([("first", 8), ("second", 7.8), ("third", 2), ("fourth", 8.2)]):
+            user = User(name, user_id, password=valid_password)
+            user.movies_table.add_movie('Movie', rank, 'Drama')
+            game.users.append(user)
+
+        game.show_main_menu()
+        assert "Users with a taste similar to first: second, fourth" in handler.all_output()
+
+
+    def test_collaborative_recommendations(self, valid_password):
+        """Tests the menu command recommending movies from the ranks of all users."""
+        handler = MockIOHandler(["1", "first", valid_password, "10", "8", "3"])
+        game = Game(handler)
+        for user_id, (name, ratings) in enumerate([("first", [('A', 9)]), ("second", [('A', 9), ('B', 8)])]):
+            user = User(name, user_id, password=valid_password)
+            user.movies_table.add_movies((title, rank, 'Drama') for title, rank in ratings)
+            game.users.append(user)
+
+        game.show_main_menu()
+        output = handler.all_output()
+        assert "Here are some recommendations based on the ranks of all users" in output
+        assert "B (predicted rank 9.0)" in output
+
+    def test_search_titles(self, valid_password):
+        """Tests the menu command searching the user's movies by the beginning of the title."""
+        handler = MockIOHandler(["1", "first", valid_password, "15", "the ", "15", "Zed", "8", "3"])
+        game = Game(handler)
+        user = User("first", 0, password=valid_password)
+        user.movies_table.add_movies([('The Thing', 8, 'Horror'), ('Them!', 6, 'Horror'), ('the Birds', 7, 'Horror')])
+        game.users.append(user)
+
+        game.show_main_menu()
+        output = handler.all_output()
+        assert "the Birds\nThe Thing" in output and "Them!" not in output
+        assert "None of your movies starts with that." in output
+
+    def test_save_and_load_binary(self, valid_password, tmp_path, monkeypatch):
+        """Tests the binary save and load commands, and that later commands use the loaded table."""
+        monkeypatch.chdir(tmp_path)
+        inputs = ["1", "testuser", valid_password, "1", "Inception", "9", "Sci-Fi", "quit", "11",
+                  "1", "Titanic", "3", "Romance", "quit", "12", "2", "8", "3"]
+        handler = MockIOHandler(inputs)
+        game = Game(handler)
+        game.users.append(User("testuser", 0, password=valid_password))
+
+        game.show_main_menu()
+        output = handler.all_output()
+        assert "Movie data saved to user_0_data." in output
+        assert "Movie data loaded successfully." in output
+        assert "The worst movie is Inception with the rank of 9" in output
+        assert list(game.users.get_by_id(0).movies_table.df['name']) == ['Inception']
@@ -1,14 +1,42 @@
+from __future__ import annotations
 import json
+import numbers
+import os
+import shutil
+import threading
+from array import array
+from bisect import bisect_left
 from enum import Enum
-from typing import Tuple
-from colorama import init, Fore, Style
-import pandas as pd
+from typing import Container, Iterable, List, Optional, Tuple
 from Handlers import CLIIOHandler, BaseIOHandler
+from instrumentation import timed
+from lazy_imports import lazy_import
+from result_cache import RESULT_CACHE, new_table_token
+from catalog import CATALOG, normalize_title
+
+colorama = lazy_import("colorama")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 BEST_MOVIE_STR = "The best movie is {name} with the rank of {rank}"
 WORST_MOVIE_STR = "The worst movie is {name} with the rank of {rank}"
 AVG_RANK_STR = "The average rank of the movies is {avg}"
 
+# Files of the binary columnar format, one directory per table
+BINARY_META_FILE = "meta.json"
+BINARY_NAME_CODES_FILE = "name_codes.npy"
+BINARY_NAME_DICTIONARY_FILE = "name_dictionary.npy"
+BINARY_GENRE_CODES_FILE = "genre_codes.npy"
+BINARY_GENRE_DICTIONARY_FILE = "genre_dictionary.npy"
+BINARY_RANKS_FILE = "ranks.npy"
+BINARY_FORMAT_VERSION = 1
+# Suffixes of the directories to_binary writes to and moves the previous table to
+BINARY_TEMPORARY_SUFFIX = ".tmp"
+BINARY_PREVIOUS_SUFFIX = ".old"
+# Rough size of a table's objects besides its columns, and of an entry of its title index, used by memory_bytes
+_TABLE_OVERHEAD_BYTES = 2048
+_TITLE_INDEX_ENTRY_BYTES = 100
+
 
 class Columns(Enum):
     Name = 'name'
@@ -21,17 +49,401 @@ class Columns(Enum):
     Recommendation_Rating = 8
 
 
-init()
+_colors_initialized = False
+
+
+def _colors():
+    """Returns colorama, initializing it on the first colored output."""
+    global _colors_initialized
+    if not _colors_initialized:
+        colorama.init()
+        _colors_initialized = True
+    return colorama
+
+
+def _table_rows(result, table, *args, **kwargs) -> int:
+    return table._stats.count
+
+
+def _compared_tables_rows(result, cls, table1, table2, *args, **kwargs) -> int:
+    return table1._stats.count + table2._stats.count
+
+
+def _loaded_table_rows(result, *args, **kwargs) -> int:
+    return result._stats.count if result else 0
+
+
+class _AppendBuffer:
+    """Columnar staging area for rows that were not merged into the table's arrays yet."""
+
+    def __init__(self):
+        self.name_ids = array('i')
+        self.genre_ids = array('i')
+        self.ranks = array('b')
+
+    def __len__(self) -> int:
+        return len(self.name_ids)
+
+    def _fit_rank(self, rank) -> None:
+        if self.ranks.typecode != 'd':
+            if not isinstance(rank, numbers.Integral):
+                # A fractional rank arrived, so widen the column once
+                self.ranks = array('d', self.ranks)
+            elif self.ranks.typecode == 'b' and not -128 <= rank <= 127:
+                self.ranks = array('q', self.ranks)
+
+    def append(self, name_id: int, rank, genre_id: int) -> None:
+        self._fit_rank(rank)
+        self.ranks.append(rank)
+        self.name_ids.append(name_id)
+        self.genre_ids.append(genre_id)
+
+    def set(self, position: int, rank, genre_id: int) -> None:
+        self._fit_rank(rank)
+        self.ranks[position] = rank
+        self.genre_ids[position] = genre_id
+
+    def clear(self) -> None:
+        self.name_ids = array('i')
+        self.genre_ids = array('i')
+        self.ranks = array('b')
+
+
+def recommended_positions(seen_keys: Container[int], title_keys: np.ndarray, ranks: np.ndarray,
+                          amount: int = 5) -> List[int]:
+    """Returns the positions of the best ranked rows above the recommendation rating whose normalized
+    title is not in seen_keys, best first. The rule of movies_recommendations_based_on_similarity.
+
+    seen_keys is typically a table's title index, so every check is a hash lookup."""
+    by_rank = np.argsort(-ranks.astype(np.float64), kind='stable')
+    above = by_rank[ranks[by_rank] > Columns.Recommendation_Rating.value]
+    positions = []
+    for position, key in zip(above.tolist(), title_keys[above].tolist()):
+        if key not in seen_keys:
+            positions.append(position)
+            if len(positions) == amount:
+                break
+    return positions
+
+
+def _rank_dtype(rank) -> np.dtype:
+    if not isinstance(rank, numbers.Integral):
+        return np.dtype(np.float64)
+    return np.dtype(np.int8 if -128 <= rank <= 127 else np.int64)
+
+
+_empty_columns = None
+
+
+def _get_empty_columns() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns read-only empty (title ids, ranks, genre ids) columns shared by the new tables."""
+    global _empty_columns
+    if _empty_columns is None:
+        ids = np.empty(0, dtype=np.int32)
+        ranks = np.empty(0, dtype=np.int8)
+        ids.flags.writeable = ranks.flags.writeable = False
+        _empty_columns = (ids, ranks, ids)
+    return _empty_columns
+
+
+def _compact_ranks(ranks) -> np.ndarray:
+    """Returns the ranks as int8 when they are small whole numbers, else as int64 or float64."""
+    ranks = np.asarray(ranks)
+    if ranks.dtype == object:
+        ranks = np.array(ranks.tolist())
+    if ranks.dtype.kind == 'f':
+        if not np.array_equal(ranks, np.round(ranks)):
+            return ranks.astype(np.float64, copy=False)
+        ranks = ranks.astype(np.int64)
+    if not len(ranks) or (ranks.min() >= -128 and ranks.max() <= 127):
+        return ranks.astype(np.int8, copy=False)
+    return ranks.astype(np.int64, copy=False)
+
+
+class _RankStats:
+    """Running aggregates of the ranks in a table, kept up to date on every change."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max_rank = None
+        self.min_rank = None
+        # rank -> number of rows with the rank
+        self._counts = {}
+        # rank -> position of the first row with the rank, None once that row was removed until the
+        # table rescans for it, see first_position
+        self._first_positions = {}
+
+    def add(self, rank, position: int) -> None:
+        self.count += 1
+        self.total += rank
+        if rank in self._counts:
+            self._counts[rank] += 1
+            first = self._first_positions[rank]
+            if first is not None and position < first:
+                self._first_positions[rank] = position
+        else:
+            self._counts[rank] = 1
+            self._first_positions[rank] = position
+        if self.max_rank is None or rank > self.max_rank:
+            self.max_rank = rank
+        if self.min_rank is None or rank < self.min_rank:
+            self.min_rank = rank
+
+    def remove(self, rank, position: int) -> None:
+        self._counts[rank] -= 1
+        self.count -= 1
+        self.total -= rank
+        if self._counts[rank]:
+            if self._first_positions[rank] == position:
+                self._first_positions[rank] = None
+            return
+        del self._counts[rank]
+        del self._first_positions[rank]
+        # Only the emptied extreme needs a rescan, over the distinct ranks (1-10)
+        if rank == self.max_rank:
+            self.max_rank = max(self._counts, default=None)
+        if rank == self.min_rank:
+            self.min_rank = min(self._counts, default=None)
+
+    def row_deleted(self, position: int) -> None:
+        """Moves the first positions after a deleted row one row up."""
+        for rank, first in self._first_positions.items():
+            if first is not None and first > position:
+                self._first_positions[rank] = first - 1
+
+    def first_position(self, rank) -> Optional[int]:
+        return self._first_positions[rank]
+
+    def set_first_position(self, rank, position: int) -> None:
+        self._first_positions[rank] = position
+
+    @classmethod
+    def from_ranks(cls, ranks: np.ndarray) -> '_RankStats':
+        stats = cls()
+        if not len(ranks):
+            return stats
+        distinct, first_positions, counts = np.unique(ranks, return_index=True, return_counts=True)
+        distinct = distinct.tolist()
+        stats.count = len(ranks)
+        stats.total = ranks.sum().item()
+        stats._counts = dict(zip(distinct, counts.tolist()))
+        stats._first_positions = dict(zip(distinct, first_positions.tolist()))
+        stats.min_rank, stats.max_rank = distinct[0], distinct[-1]
+        return stats
+
+
+class _GenreProfile:
+    """Running (sum, count) of the ranks per genre, the input of are_similar."""
+
+    def __init__(self):
+        self._totals = {}
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def add(self, genre: str, rank) -> None:
+        totals = self._totals.get(genre)
+        if totals is None:
+            self._totals[genre] = [rank, 1]
+        else:
+            totals[0] += rank
+            totals[1] += 1
+
+    def remove(self, genre: str, rank) -> None:
+        totals = self._totals[genre]
+        totals[1] -= 1
+        if totals[1]:
+            totals[0] -= rank
+        else:
+            del self._totals[genre]
+
+    def means(self) -> dict:
+        return {genre: total / count for genre, (total, count) in self._totals.items()}
+
+    @classmethod
+    def from_columns(cls, genre_ids: np.ndarray, ranks: np.ndarray) -> '_GenreProfile':
+        profile = cls()
+        if not len(ranks):
+            return profile
+        distinct, first_positions, inverse, counts = np.unique(genre_ids, return_index=True, return_inverse=True,
+                                                               return_counts=True)
+        totals = np.bincount(inverse, weights=ranks)
+        if ranks.dtype.kind != 'f':
+            totals = totals.astype(np.int64)
+        # In the order the genres first appear, as rows added one at a time would be
+        for i in np.argsort(first_positions, kind='stable').tolist():
+            profile._totals[CATALOG.genre(int(distinct[i]))] = [totals[i].item(), int(counts[i])]
+        return profile
+
+
+class _GenreIndex:
+    """Rows grouped by lower-cased genre, every group sorted from the best rank down."""
+
+    def __init__(self, name_ids: np.ndarray, ranks: np.ndarray, genre_ids: np.ndarray):
+        self._name_ids = name_ids
+        self._ranks = ranks
+        self._genre_ids = genre_ids
+        # genre key -> positions of its rows, best first
+        self.movies = {}
+        # genre as entered -> number of movies, in order of first appearance
+        self.spellings = {}
+        if not len(ranks):
+            return
+        distinct_genres, first_positions, counts = np.unique(genre_ids, return_index=True, return_counts=True)
+        for position in np.argsort(first_positions, kind='stable'):
+            self.spellings[CATALOG.genre(int(distinct_genres[position]))] = int(counts[position])
+
+        by_rank = np.argsort(-ranks.astype(np.float64), kind='stable')
+        keys = CATALOG.genre_keys_of(genre_ids[by_rank])
+        by_key = np.argsort(keys, kind='stable')
+        sorted_keys = keys[by_key]
+        distinct_keys, starts = np.unique(sorted_keys, return_index=True)
+        for key_id, rows in zip(distinct_keys.tolist(), np.split(by_rank[by_key], starts[1:])):
+            self.movies[CATALOG.genre_key(key_id)] = rows
+
+    def row(self, position: int) -> Tuple[str, object, str]:
+        return (CATALOG.title(int(self._name_ids[position])), self._ranks[position].item(),
+                CATALOG.genre(int(self._genre_ids[position])))
+
+    def session(self) -> '_RecommendationSession':
+        return _RecommendationSession(self)
+
+
+class _RecommendationSession:
+    """Walks a genre index with one cursor per genre, so the index itself is never copied."""
+
+    def __init__(self, index: _GenreIndex):
+        self._index = index
+        self._cursors = {}
+        self._spellings_left = dict(index.spellings)
+        self.remaining = sum(index.spellings.values())
+
+    def available_genres(self) -> List[str]:
+        return [genre for genre, count in self._spellings_left.items() if count]
+
+    def pop_best(self, genre: str) -> Optional[Tuple[str, int]]:
+        key = genre.lower()
+        rows = self._index.movies.get(key, ())
+        position = self._cursors.get(key, 0)
+        if position >= len(rows):
+            return None
+        name, rank, entered_genre = self._index.row(rows[position])
+        self._cursors[key] = position + 1
+        self._spellings_left[entered_genre] -= 1
+        self.remaining -= 1
+        return name, rank
 
 
 class User_movie_table:
+    # Called with the table after every change of any table, e.g. by GenreLSHIndex
+    change_listeners = []
+
     def __init__(self, user_id: int, handler=CLIIOHandler()):
         self.user_id = user_id
-        self.df = pd.DataFrame(
-            columns=[Columns.Name.value, Columns.Rank.value, Columns.Genre.value, Columns.User_ID.value])
+        # Rows as columns of CATALOG title ids, ranks and CATALOG genre ids
+        self._name_ids, self._ranks, self._genre_ids = _get_empty_columns()
+        self._pending = _AppendBuffer()
+        # normalized title id -> position of the title's row, a movie has a single row
+        self._title_index = {}
+        self._stats = _RankStats()
+        self._genre_profile = _GenreProfile()
+        self._version = 0
+        # Cached query results are keyed by the token and the version, see ResultCache
+        self._cache_token = new_table_token()
+        self._cached = False
+        # Storage log the changes are written to, set for the tables of registered users
+        self.journal = None
         self.handler = handler
+        # Sessions of the same user share the table from different threads. Its rows, index and
+        # aggregates change under the lock, while _changed() and the journal run after releasing it,
+        # as both take locks of their own that are held while reading tables (e.g. during a snapshot).
+        self._lock = threading.RLock()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The rows as a DataFrame of name, rank, genre and user_id, built on read and cached until
+        the table changes."""
+        return RESULT_CACHE.get_or_compute("frame", (self,), self._to_frame)
+
+    @df.setter
+    def df(self, value: pd.DataFrame) -> None:
+        if value.empty:
+            self._set_columns(*_get_empty_columns())
+        else:
+            self._set_columns(CATALOG.title_ids(value[Columns.Name.value].tolist()),
+                              value[Columns.Rank.value].to_numpy(),
+                              CATALOG.genre_ids(value[Columns.Genre.value].tolist()))
+        if self.journal is not None:
+            self.journal.log_table_replaced(self.user_id, self)
+
+    def _set_columns(self, name_ids: np.ndarray, ranks: np.ndarray, genre_ids: np.ndarray) -> None:
+        keys = CATALOG.title_keys_of(name_ids)
+        distinct_keys, first_positions = np.unique(keys, return_index=True)
+        if len(distinct_keys) < len(keys):
+            # Rows of a movie entered more than once, as add_movie would have kept them: at the
+            # position of the first entry with the rank and genre of the last one
+            last_positions = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+            order = np.argsort(first_positions)
+            name_ids = name_ids[first_positions[order]]
+            ranks = np.asarray(ranks)[last_positions[order]]
+            genre_ids = genre_ids[last_positions[order]]
+            keys = distinct_keys[order]
+        ranks = _compact_ranks(ranks)
+        stats = _RankStats.from_ranks(ranks)
+        genre_profile = _GenreProfile.from_columns(genre_ids, ranks)
+        title_index = dict(zip(keys.tolist(), range(len(keys))))
+        with self._lock:
+            self._pending.clear()
+            self._name_ids, self._ranks, self._genre_ids = name_ids, ranks, genre_ids
+            self._title_index = title_index
+            self._stats = stats
+            self._genre_profile = genre_profile
+        self._changed()
+
+    def _to_frame(self) -> pd.DataFrame:
+        name_ids, ranks, genre_ids = self.columns()
+        return pd.DataFrame({
+            Columns.Name.value: CATALOG.titles_of(name_ids),
+            Columns.Rank.value: ranks,
+            Columns.Genre.value: CATALOG.genres_of(genre_ids),
+            Columns.User_ID.value: np.full(len(ranks), self.user_id)
+        })
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the (title ids, ranks, genre ids) columns of the rows, the ids are CATALOG ids."""
+        with self._lock:
+            self._flush()
+            return self._name_ids, self._ranks, self._genre_ids
+
+    def memory_bytes(self) -> int:
+        """Returns the approximate memory taken by the table."""
+        with self._lock:
+            pending = self._pending
+            return (_TABLE_OVERHEAD_BYTES + self._name_ids.nbytes + self._ranks.nbytes + self._genre_ids.nbytes +
+                    len(self._title_index) * _TITLE_INDEX_ENTRY_BYTES +
+                    len(pending) * (pending.name_ids.itemsize + pending.genre_ids.itemsize + pending.ranks.itemsize))
+
+    def _changed(self) -> None:
+        self._version += 1
+        if self._cached:
+            RESULT_CACHE.invalidate(self)
+        for listener in User_movie_table.change_listeners:
+            listener(self)
+
+    def _flush(self) -> None:
+        # New rows are merged in one concatenation per read instead of one per movie, called under self._lock
+        pending = self._pending
+        if not len(pending):
+            return
+        new_ranks = np.frombuffer(pending.ranks, dtype=pending.ranks.typecode)
+        self._name_ids = np.concatenate([self._name_ids, np.frombuffer(pending.name_ids, dtype=np.int32)])
+        self._ranks = np.concatenate([self._ranks, new_ranks.astype(np.result_type(self._ranks, new_ranks))])
+        self._genre_ids = np.concatenate([self._genre_ids, np.frombuffer(pending.genre_ids, dtype=np.int32)])
+        self._pending = _AppendBuffer()
 
     @classmethod
+    @timed(rows=_loaded_table_rows)
     def create_from_json(cls, path: str, handler=CLIIOHandler()):
         try:
             with open(path, "r") as file:
@@ -40,51 +452,165 @@ class User_movie_table:
             handler.display_output("JSON file not found.")
             return None
         else:
-            instance = cls(data[Columns.JSON_USER_ID.value])
-            instance.df = pd.DataFrame(data[Columns.JSON_MOVIES_DATA.value])
+            instance = cls(data[Columns.JSON_USER_ID.value], handler)
+            rows = data[Columns.JSON_MOVIES_DATA.value]
+            instance._set_columns(CATALOG.title_ids(row[Columns.Name.value] for row in rows),
+                                  np.array([row[Columns.Rank.value] for row in rows]),
+                                  CATALOG.genre_ids(row[Columns.Genre.value] for row in rows))
             return instance
 
-    def _get_movie_rank(self, movie_name: str) -> int:
-        rank_str = self.handler.get_user_input(f"Please enter you rank for the movie {movie_name} from 1-10: ")
+    @classmethod
+    @timed(rows=_loaded_table_rows)
+    def create_from_binary(cls, path: str, handler=CLIIOHandler()):
+        """Loads a table saved by to_binary. The files are read whole, not memory-mapped, so a loaded
+        table holds no open mappings: the codes are translated to catalog ids with one take per column
+        and the ranks are used as saved, in their compact dtype."""
+        if not os.path.exists(path) and os.path.exists(path + BINARY_PREVIOUS_SUFFIX):
+            # to_binary was interrupted between moving the previous table aside and moving the new one in
+            path = path + BINARY_PREVIOUS_SUFFIX
+        try:
+            with open(os.path.join(path, BINARY_META_FILE), "r") as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            handler.display_output("Binary file not found.")
+            return None
+
+        def load(file_name):
+            return np.load(os.path.join(path, file_name))
+
+        # The dictionaries are translated to catalog ids once, the rows with a single take
+        name_ids = CATALOG.title_ids(load(BINARY_NAME_DICTIONARY_FILE).tolist())[load(BINARY_NAME_CODES_FILE)]
+        genre_ids = CATALOG.genre_ids(load(BINARY_GENRE_DICTIONARY_FILE).tolist())[load(BINARY_GENRE_CODES_FILE)]
+        instance = cls(meta[Columns.JSON_USER_ID.value], handler)
+        instance._set_columns(name_ids, load(BINARY_RANKS_FILE), genre_ids)
+        return instance
+
+    def _get_movie_rank(self, movie_name: str, handler: BaseIOHandler) -> int:
+        rank_str = handler.get_user_input(f"Please enter you rank for the movie {movie_name} from 1-10: ")
         try:
             rank = int(rank_str)
             if not 1 <= rank <= 10:
                 raise ValueError
         except (ValueError, TypeError):
-            self.handler.display_output("Invalid input. Sets rank to 5")
+            handler.display_output("Invalid input. Sets rank to 5")
             rank = 5
         return rank
 
-    def add_movies_from_user(self):
+    @timed(rows=_table_rows)
+    def add_movies_from_user(self, handler: BaseIOHandler = None):
+        # A table may be shared by several sessions, each passes its own handler
+        handler = handler or self.handler
         while True:
-            movie_name = self.handler.get_user_input("Please enter a movie name (or 'quit' to finish): ")
+            movie_name = handler.get_user_input("Please enter a movie name (or 'quit' to finish): ")
             if movie_name.lower() == 'quit':
                 break
-            rank = self._get_movie_rank(movie_name)
-            genre = self.handler.get_user_input(f"Please enter the genre of the movie {movie_name}: ")
-            new_row = {
-                Columns.Name.value: movie_name,
-                Columns.Rank.value: rank,
-                Columns.Genre.value: genre,
-                Columns.User_ID.value: self.user_id
-            }
-            new_row_df = pd.DataFrame([new_row])
-            self.df = pd.concat([self.df, new_row_df], ignore_index=True)
+            rank = self._get_movie_rank(movie_name, handler)
+            genre = handler.get_user_input(f"Please enter the genre of the movie {movie_name}: ")
+            self.add_movie(movie_name, rank, genre)
+
+    def add_movie(self, movie_name: str, rank, genre: str) -> None:
+        """Adds a movie, or re-ranks it in place if the table has it under any spelling of its title."""
+        genre_id = CATALOG.genre_id(genre)
+        name_id = CATALOG.title_id(movie_name)
+        key = CATALOG.title_key(name_id)
+        with self._lock:
+            position = self._title_index.get(key)
+            if position is None:
+                position = self._title_index[key] = len(self._name_ids) + len(self._pending)
+                self._pending.append(name_id, rank, genre_id)
+            else:
+                self._replace_row(position, rank, genre_id)
+            self._stats.add(rank, position)
+            self._genre_profile.add(CATALOG.genre(genre_id), rank)
+        self._changed()
+        if self.journal is not None:
+            self.journal.log_rating(self.user_id, movie_name, rank, genre)
+
+    def _replace_row(self, position: int, rank, genre_id: int) -> None:
+        # Called under self._lock
+        flushed = len(self._name_ids)
+        if position < flushed:
+            old_rank, old_genre_id = self._ranks[position].item(), int(self._genre_ids[position])
+        else:
+            old_rank, old_genre_id = self._pending.ranks[position - flushed], self._pending.genre_ids[position - flushed]
+        self._stats.remove(old_rank, position)
+        self._genre_profile.remove(CATALOG.genre(old_genre_id), old_rank)
+        if position >= flushed:
+            self._pending.set(position - flushed, rank, genre_id)
+            return
+        # The columns may be shared with a frame or the read-only empties, so they are copied, not written
+        self._ranks = self._ranks.astype(np.result_type(self._ranks, _rank_dtype(rank)))
+        self._ranks[position] = rank
+        self._genre_ids = self._genre_ids.copy()
+        self._genre_ids[position] = genre_id
+
+    @timed(rows=_table_rows)
+    def add_movies(self, rows: Iterable[Tuple[str, int, str]]) -> None:
+        """Adds many (name, rank, genre) rows at once."""
+        for movie_name, rank, genre in rows:
+            self.add_movie(movie_name, rank, genre)
+
+    @timed(rows=_table_rows)
+    def remove_movie(self, movie_name: str) -> int:
+        """Removes the movie, under any spelling of its title, and returns how many rows were removed."""
+        key = CATALOG.find_title_key(movie_name)
+        with self._lock:
+            position = self._title_index.pop(key, None) if key is not None else None
+            if position is None:
+                return 0
+            name_ids, ranks, genre_ids = self.columns()
+            rank = ranks[position].item()
+            self._stats.remove(rank, position)
+            self._stats.row_deleted(position)
+            self._genre_profile.remove(CATALOG.genre(int(genre_ids[position])), rank)
+            keep = np.arange(len(name_ids)) != position
+            self._name_ids, self._ranks, self._genre_ids = name_ids[keep], ranks[keep], genre_ids[keep]
+            for other_key, other_position in self._title_index.items():
+                if other_position > position:
+                    self._title_index[other_key] = other_position - 1
+        self._changed()
+        if self.journal is not None:
+            self.journal.log_removal(self.user_id, movie_name)
+        return 1
+
+    def _first_with_rank(self, rank) -> str:
+        # Ties go to the movie entered first, called under self._lock
+        position = self._stats.first_position(rank)
+        if position is None:
+            # Its first row was removed or re-ranked, the only case that scans the ranks
+            name_ids, ranks, _ = self.columns()
+            position = int(np.argmax(ranks == rank))
+            self._stats.set_first_position(rank, position)
+        flushed = len(self._name_ids)
+        name_id = self._name_ids[position] if position < flushed else self._pending.name_ids[position - flushed]
+        return CATALOG.title(int(name_id))
 
     def get_best_movie(self) -> Tuple[str, int]:
-        temp_df = self.df.sort_values(by=Columns.Rank.value, ascending=False)
-        return temp_df.iloc[0][Columns.Name.value], temp_df.iloc[0][Columns.Rank.value]
+        with self._lock:
+            if not self._stats.count:
+                raise IndexError("The table has no movies.")
+            rank = self._stats.max_rank
+            return self._first_with_rank(rank), rank
 
     def get_worst_movie(self) -> Tuple[str, int]:
-        temp_df = self.df.sort_values(by=Columns.Rank.value, ascending=True)
-        return temp_df.iloc[0][Columns.Name.value], temp_df.iloc[0][Columns.Rank.value]
+        with self._lock:
+            if not self._stats.count:
+                raise IndexError("The table has no movies.")
+            rank = self._stats.min_rank
+            return self._first_with_rank(rank), rank
 
     def get_avg_ranking(self) -> float:
-        return round(self.df[Columns.Rank.value].mean(), 2)
-
-    def print_basic_stats(self) -> None:
-        if self.df.empty:
-            self.handler.display_output("No movies in the list to calculate stats.")
+        with self._lock:
+            if not self._stats.count:
+                # The mean of no ranks, as pandas gives it
+                return float('nan')
+            return round(self._stats.total / self._stats.count, 2)
+
+    @timed(rows=_table_rows)
+    def print_basic_stats(self, handler: BaseIOHandler = None) -> None:
+        handler = handler or self.handler
+        if not self._stats.count:
+            handler.display_output("No movies in the list to calculate stats.")
             return
 
         best_movie = self.get_best_movie()
@@ -96,75 +622,104 @@ class User_movie_table:
         avg_movie = self.get_avg_ranking()
         avg_movie_str = AVG_RANK_STR.format(avg=avg_movie)
 
-        self.handler.display_output(Fore.GREEN + best_movie_str + Style.RESET_ALL)
-        self.handler.display_output(Fore.RED + worst_movie_str + Style.RESET_ALL)
-        self.handler.display_output(Fore.YELLOW + avg_movie_str + Style.RESET_ALL)
+        colors = _colors()
+        handler.display_output(colors.Fore.GREEN + best_movie_str + colors.Style.RESET_ALL)
+        handler.display_output(colors.Fore.RED + worst_movie_str + colors.Style.RESET_ALL)
+        handler.display_output(colors.Fore.YELLOW + avg_movie_str + colors.Style.RESET_ALL)
 
     @classmethod
-    def _get_movie_recommendation(cls, movies_df: pd.DataFrame, handler=CLIIOHandler()) -> None:
-        if movies_df.empty:
-            handler.display_output("No more movies available for recommendations.")
-            return
-
-        available_genres = movies_df[Columns.Genre.value].unique()
-        handler.display_output(f"Available genres: {', '.join(available_genres)}")
-        genre = handler.get_user_input("Please enter the genre you're interested in: ")
-
-        potential_movies = movies_df[movies_df[Columns.Genre.value].str.lower() == genre.lower()]
-        current_recommendation = None
-
-        if not potential_movies.empty:
-            potential_movies = potential_movies.sort_values(by=Columns.Rank.value, ascending=False)
-            current_recommendation = potential_movies.iloc[0]
-            handler.display_output(f"Our best movie from {genre} genre is {current_recommendation[Columns.Name.value]} "
-                                   f"with the rank of {current_recommendation[Columns.Rank.value]}")
-        else:
-            handler.display_output("We don't have any movies answering to this genre name.")
-
-        another_recommendation = handler.get_user_input("Enter 'exit' to finish and any other input to proceed: ")
-        if another_recommendation.lower() == 'exit':
+    def _get_movie_recommendation(cls, session: '_RecommendationSession', handler=CLIIOHandler()) -> None:
+        while True:
+            if not session.remaining:
+                handler.display_output("No more movies available for recommendations.")
+                return
+
+            handler.display_output(f"Available genres: {', '.join(session.available_genres())}")
+            genre = handler.get_user_input("Please enter the genre you're interested in: ")
+
+            current_recommendation = session.pop_best(genre)
+            if current_recommendation is not None:
+                name, rank = current_recommendation
+                handler.display_output(f"Our best movie from {genre} genre is {name} with the rank of {rank}")
+            else:
+                handler.display_output("We don't have any movies answering to this genre name.")
+
+            another_recommendation = handler.get_user_input("Enter 'exit' to finish and any other input to proceed: ")
+            if another_recommendation.lower() == 'exit':
+                return
+
+    def _get_genre_index(self) -> '_GenreIndex':
+        return RESULT_CACHE.get_or_compute("genre_index", (self,), lambda: _GenreIndex(*self.columns()))
+
+    @timed(rows=_table_rows)
+    def get_movie_recommendation(self, handler: BaseIOHandler = None) -> None:
+        handler = handler or self.handler
+        if not self._stats.count:
+            handler.display_output("No movies available for recommendations. Please add some movies first.")
             return
+        self._get_movie_recommendation(self._get_genre_index().session(), handler)
+
+    def has_movie(self, movie_name: str) -> bool:
+        """Tells if the table has the movie under any spelling of its title."""
+        key = CATALOG.find_title_key(movie_name)
+        return key is not None and key in self._title_index
+
+    def _sorted_titles(self) -> Tuple[List[str], List[str]]:
+        # (normalized titles, titles as entered), both sorted by the normalized title
+        with self._lock:
+            name_ids = self.columns()[0]
+            keys = sorted(self._title_index.items(), key=lambda item: CATALOG.normalized_title(item[0]))
+        return ([CATALOG.normalized_title(key) for key, _ in keys],
+                [CATALOG.title(int(name_ids[position])) for _, position in keys])
+
+    def search_titles(self, prefix: str, limit: int = 10) -> List[str]:
+        """Returns up to limit titles of the table starting with prefix, ignoring case, in alphabetical order."""
+        normalized = normalize_title(prefix)
+        if normalized and prefix[-1].isspace():
+            # "star " finds "Star Wars" but not "Stardust"
+            normalized += " "
+        normalized_titles, titles = RESULT_CACHE.get_or_compute("sorted_titles", (self,), self._sorted_titles)
+        start = bisect_left(normalized_titles, normalized)
+        matches = []
+        for position in range(start, min(start + limit, len(titles))):
+            if not normalized_titles[position].startswith(normalized):
+                break
+            matches.append(titles[position])
+        return matches
 
-        if current_recommendation is not None:
-            new_movies_df = movies_df.drop(current_recommendation.name)
-            cls._get_movie_recommendation(new_movies_df, handler)
-        else:
-            cls._get_movie_recommendation(movies_df, handler)
-
-    def get_movie_recommendation(self) -> None:
-        if self.df.empty:
-            self.handler.display_output("No movies available for recommendations. Please add some movies first.")
-            return
-        self._get_movie_recommendation(self.df.copy(), self.handler)
+    def get_genre_means(self) -> dict:
+        """Returns the mean rank of every genre in the table."""
+        with self._lock:
+            return self._genre_profile.means()
 
     @classmethod
+    @timed(rows=_compared_tables_rows)
     def are_similar(cls, table1: 'User_movie_table', table2: 'User_movie_table') -> bool:
-        if table1.df.empty or table2.df.empty:
+        return RESULT_CACHE.get_or_compute("are_similar", (table1, table2),
+                                           lambda: cls._compute_are_similar(table1, table2))
+
+    @staticmethod
+    def _compute_are_similar(table1: 'User_movie_table', table2: 'User_movie_table') -> bool:
+        if not len(table1._genre_profile) or not len(table2._genre_profile):
             return False
 
-        first_genres_vector = table1.df.groupby(Columns.Genre.value)[Columns.Rank.value].mean()
-        second_genres_vector = table2.df.groupby(Columns.Genre.value)[Columns.Rank.value].mean()
+        first_genres_vector = table1.get_genre_means()
+        second_genres_vector = table2.get_genre_means()
 
-        if set(first_genres_vector.index) != set(second_genres_vector.index):
+        if first_genres_vector.keys() != second_genres_vector.keys():
             return False
 
-        diff = (first_genres_vector - second_genres_vector).abs()
-        return diff.max() <= Columns.Similarity_Treshold.value
+        diff = max(abs(mean - second_genres_vector[genre]) for genre, mean in first_genres_vector.items())
+        return diff <= Columns.Similarity_Treshold.value
 
     @classmethod
+    @timed(rows=_compared_tables_rows)
     def movies_recommendations_based_on_similarity(cls, cls1, cls2, handler: CLIIOHandler) -> None:
         if not User_movie_table.are_similar(cls1, cls2):
             return
 
-        sorted_df = cls2.df.sort_values(by=Columns.Rank.value, ascending=False)
-        recommendations = []
-        for _, row in sorted_df.iterrows():
-            if (row[Columns.Name.value] not in cls1.df[Columns.Name.value].values and
-                    row[Columns.Rank.value] > Columns.Recommendation_Rating.value):
-                if len(recommendations) < 5:
-                    recommendations.append(row[Columns.Name.value])
-                else:
-                    break
+        recommendations = RESULT_CACHE.get_or_compute(
+            "similarity_recommendations", (cls1, cls2), lambda: cls._similarity_recommendations(cls1, cls2))
 
         if not recommendations:
             handler.display_output("There are no recommendations.")
@@ -173,8 +728,58 @@ class User_movie_table:
             for title in recommendations:
                 handler.display_output(title)
 
+    @staticmethod
+    def _similarity_recommendations(table1: 'User_movie_table', table2: 'User_movie_table') -> List[str]:
+        name_ids, ranks, _ = table2.columns()
+        # The locks are taken one after the other, never both at once
+        with table1._lock:
+            positions = recommended_positions(table1._title_index, CATALOG.title_keys_of(name_ids), ranks)
+        return CATALOG.titles_of(name_ids[positions]).tolist()
+
+    def iter_rows(self) -> Iterable[Tuple[str, object, str]]:
+        """Yields the (name, rank, genre) rows in the order they were added."""
+        name_ids, ranks, genre_ids = self.columns()
+        return zip(CATALOG.titles_of(name_ids).tolist(), ranks.tolist(), CATALOG.genres_of(genre_ids).tolist())
+
+    @timed(rows=_table_rows)
     def to_json(self):
         dict1 = {Columns.User_ID.value: self.user_id,
-                 Columns.JSON_MOVIES_DATA.value: self.df.to_dict(orient="records")}
+                 Columns.JSON_MOVIES_DATA.value: [
+                     {Columns.Name.value: name, Columns.Rank.value: rank, Columns.Genre.value: genre,
+                      Columns.User_ID.value: self.user_id} for name, rank, genre in self.iter_rows()]}
         with open(f"user_{self.user_id}_data.json", "w") as file:
-            json.dump(dict1, file, indent=2)
\ No newline at end of file
+            json.dump(dict1, file, indent=2)
+
+    @timed(rows=_table_rows)
+    def to_binary(self, path: Optional[str] = None) -> str:
+        """Saves the table as dictionary-encoded NumPy columns in a directory and returns its path.
+
+        The files are written to a temporary directory that then replaces the previous one, so a load
+        never sees a mix of old and new files."""
+        path = (path or f"user_{self.user_id}_data").rstrip(os.sep)
+        final_path, path = path, path + BINARY_TEMPORARY_SUFFIX
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        name_ids, ranks, genre_ids = self.columns()
+        name_dictionary, name_codes = np.unique(name_ids, return_inverse=True)
+        genre_dictionary, genre_codes = np.unique(genre_ids, return_inverse=True)
+        name_dictionary = CATALOG.titles_of(name_dictionary)
+        genre_dictionary = CATALOG.genres_of(genre_dictionary)
+
+        np.save(os.path.join(path, BINARY_NAME_CODES_FILE), np.asarray(name_codes, dtype=np.int32))
+        np.save(os.path.join(path, BINARY_NAME_DICTIONARY_FILE), np.asarray(name_dictionary, dtype=str))
+        np.save(os.path.join(path, BINARY_GENRE_CODES_FILE), np.asarray(genre_codes, dtype=np.int32))
+        np.save(os.path.join(path, BINARY_GENRE_DICTIONARY_FILE), np.asarray(genre_dictionary, dtype=str))
+        np.save(os.path.join(path, BINARY_RANKS_FILE), ranks)
+        with open(os.path.join(path, BINARY_META_FILE), "w") as file:
+            json.dump({Columns.JSON_USER_ID.value: self.user_id, "format_version": BINARY_FORMAT_VERSION}, file)
+
+        # A directory with files can't be replaced in one rename, the previous one is moved aside
+        # first, and create_from_binary falls back to it if the second rename never happens
+        previous_path = final_path + BINARY_PREVIOUS_SUFFIX
+        if os.path.exists(final_path):
+            shutil.rmtree(previous_path, ignore_errors=True)
+            os.replace(final_path, previous_path)
+        os.replace(path, final_path)
+        shutil.rmtree(previous_path, ignore_errors=True)
+        return final_path
@@ -0,0 +1,89 @@
+import threading
+from typing import Iterable, Iterator, Optional
+from users import User
+
+
+class UserRegistry:
+    """The registered users, indexed by user name and by id.
+
+    Ids are allocated after the highest id ever registered rather than from the amount of users, so
+    users loaded from storage keep their ids and new users never get an id that was already used."""
+
+    def __init__(self, users: Iterable[User] = ()):
+        self._by_name = {}
+        self._by_id = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.journal = None
+        self.table_store = None
+        for user in users:
+            self.add(user)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[User]:
+        # Copied, so sessions registering users at the same time don't break the iteration
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, user_name: str) -> bool:
+        return user_name in self._by_name
+
+    def get(self, user_name: str) -> Optional[User]:
+        return self._by_name.get(user_name)
+
+    def get_by_id(self, user_id: int) -> Optional[User]:
+        return self._by_id.get(user_id)
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    def add(self, user: User) -> None:
+        """Adds an existing user. Raises ValueError if the user name or the id is taken."""
+        with self._lock:
+            if user.user_name in self._by_name or user.id in self._by_id:
+                raise ValueError(f"User {user.user_name} with id {user.id} is already registered.")
+            self._by_name[user.user_name] = user
+            self._by_id[user.id] = user
+            self._next_id = max(self._next_id, user.id + 1)
+            self._attach_table_store(user)
+            if self.journal is not None:
+                user.attach_journal(self.journal)
+                self.journal.log_signup(user)
+
+    # The registry replaces a plain list of users
+    append = add
+
+    def register(self, user_name: str, password_hash: bytes) -> Optional[User]:
+        """Creates a user with the next free id, or returns None if the user name is taken."""
+        with self._lock:
+            if user_name in self._by_name:
+                return None
+            user = User(user_name, self._next_id, password_hash=password_hash)
+            self._by_name[user_name] = user
+            self._by_id[user.id] = user
+            self._next_id += 1
+            self._attach_table_store(user)
+            if self.journal is not None:
+                user.attach_journal(self.journal)
+                self.journal.log_signup(user)
+            return user
+
+    def _attach_table_store(self, user: User) -> None:
+        if self.table_store is not None:
+            user.table_store = self.table_store
+            if user._movies_table is not None:
+                self.table_store.adopt(user)
+
+    def attach_table_store(self, table_store) -> None:
+        """Lets the table store load and evict the movie tables of the users, see TableStore."""
+        self.table_store = table_store
+        for user in self._by_id.values():
+            self._attach_table_store(user)
+
+    def attach_journal(self, journal) -> None:
+        """Sends every later signup, rating and password change of the users to the journal."""
+        self.journal = journal
+        for user in self._by_id.values():
+            user.attach_journal(journal)
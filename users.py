@@ -1,21 +1,71 @@
-from typing import List, Dict, Tuple, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Dict, Tuple, Optional
 from user_movies_table import User_movie_table
 import re
-import bcrypt
+import config
+from instrumentation import timed
+from lazy_imports import lazy_import
 from Handlers import BaseIOHandler, CLIIOHandler
 
+bcrypt = lazy_import("bcrypt")
+
+# Password hash of accounts created without a password (e.g. bulk imported), nobody can log in to them
+NO_PASSWORD = b""
+
 
 class Authentication:
+    rounds = config.bcrypt_rounds
+    max_workers = config.bcrypt_workers
+    _executor = None
+
+    @classmethod
+    def configure(cls, rounds: Optional[int] = None, max_workers: Optional[int] = None) -> None:
+        """Sets the bcrypt work factor and the size of the hashing thread pool."""
+        if rounds is not None:
+            cls.rounds = rounds
+        if max_workers is not None and max_workers != cls.max_workers:
+            cls.max_workers = max_workers
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False)
+                cls._executor = None
+
     @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        # bcrypt releases the GIL while hashing, so threads run the hashes on all cores
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=cls.max_workers, thread_name_prefix="bcrypt")
+        return cls._executor
+
+    @classmethod
+    @timed
     def hash_password(cls, password: str) -> bytes:
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=cls.rounds)
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed
 
     @classmethod
+    @timed
     def check_password(cls, password: str, hashed: bytes) -> bool:
+        if not hashed:
+            return False
         return bcrypt.checkpw(password.encode('utf-8'), hashed)
 
+    @classmethod
+    @timed
+    def hash_passwords(cls, passwords: Iterable[str]) -> List[bytes]:
+        """Hashes many passwords in parallel, keeping their order."""
+        return list(cls._get_executor().map(cls.hash_password, passwords))
+
+    @classmethod
+    def hash_password_async(cls, password: str) -> Future:
+        """Hashes the password in the pool, so however many sessions log in at once no more than
+        max_workers hashes compete for the cores."""
+        return cls._get_executor().submit(cls.hash_password, password)
+
+    @classmethod
+    def check_password_async(cls, password: str, hashed: bytes) -> Future:
+        return cls._get_executor().submit(cls.check_password, password, hashed)
+
     @classmethod
     def get_valid_password(cls, handler: CLIIOHandler):
         pattern = re.compile(
@@ -40,11 +90,52 @@ class Authentication:
 
 
 class User:
-    def __init__(self, user_name:str, user_id:int, password=None, handler=None):
+    # Slots keep a registered user small, a million of them fit in one process
+    __slots__ = ('user_name', 'password', 'id', '_movies_table', 'journal', 'table_store')
+
+    def __init__(self, user_name:str, user_id:int, password=None, handler=None, password_hash=None):
         self.user_name = user_name
-        self.password = self.generate_password(password, handler)
+        if password_hash is None:
+            password_hash = self.generate_password(password, handler)
+        self.password = password_hash
         self.id = user_id
-        self.movies_table = User_movie_table(self.id)
+        self._movies_table = None
+        # Storage log of the user's changes, see StorageEngine
+        self.journal = None
+        # Keeps the table in memory or in a file when set, see TableStore
+        self.table_store = None
+
+    @property
+    def movies_table(self) -> User_movie_table:
+        # Created on first use, most registered users are never loaded in a session
+        if self.table_store is not None:
+            return self.table_store.load(self)
+        if self._movies_table is None:
+            self._movies_table = User_movie_table(self.id)
+            self._movies_table.journal = self.journal
+        return self._movies_table
+
+    @movies_table.setter
+    def movies_table(self, table: User_movie_table) -> None:
+        self._movies_table = table
+        table.journal = self.journal
+        if self.table_store is not None:
+            self.table_store.adopt(self)
+        if self.journal is not None:
+            self.journal.log_table_replaced(self.id, table)
+        # The user's movies changed even if the new table never does, its listeners are told
+        table._changed()
+
+    @property
+    def has_movies_table(self) -> bool:
+        """Tells, without creating or loading a table, if the user may have movies: a table was
+        created, or the table store holds one in a file."""
+        return self._movies_table is not None or (self.table_store is not None and self.table_store.has_file(self.id))
+
+    def attach_journal(self, journal) -> None:
+        self.journal = journal
+        if self._movies_table is not None:
+            self._movies_table.journal = journal
 
     @classmethod
     def create_from_user_input(cls, user_id: int, handler: BaseIOHandler):
@@ -60,8 +151,10 @@ class User:
 
     def change_password(self, handler: BaseIOHandler):
         current_password_guess = handler.get_user_input("Please enter your current password: ")
-        if Authentication.check_password(current_password_guess, self.password):
-            self.password = self.generate_password(handler=handler)
+        if Authentication.check_password_async(current_password_guess, self.password).result():
+            self.password = Authentication.hash_password_async(Authentication.get_valid_password(handler)).result()
+            if self.journal is not None:
+                self.journal.log_password_change(self.id, self.password)
             handler.display_output("Password changed successfully.")
         else:
             handler.display_output("Invalid password.")
\ No newline at end of file